@@ -8,6 +8,9 @@ import json
 import logging
 from datetime import datetime
 
+from app.sql_validator import sql_validator
+from app.keyword_matcher import match_question, QuestionMatches, INTENT_KEYWORDS
+
 # Configurar logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -61,31 +64,18 @@ class QueryAnalyzerAgent(BaseAgent):
     
     def __init__(self):
         super().__init__("query_analyzer", AgentType.QUERY_ANALYZER)
+        # Palavras-chave de cada intenção: app.keyword_matcher.INTENT_KEYWORDS
+        intent_importance = {
+            "aggregation": 0.8,
+            "filtering": 0.7,
+            "comparison": 0.9,
+            "trend": 0.85,
+            "distribution": 0.75,
+            "correlation": 0.9
+        }
         self.intent_patterns = {
-            "aggregation": {
-                "keywords": ["média", "total", "soma", "count", "máximo", "mínimo", "average", "sum", "max", "min"],
-                "importance": 0.8
-            },
-            "filtering": {
-                "keywords": ["onde", "filter", "com", "que", "when", "where", "igual", "maior", "menor", "entre"],
-                "importance": 0.7
-            },
-            "comparison": {
-                "keywords": ["comparar", "diferença", "versus", "vs", "compare", "difference", "em relação"],
-                "importance": 0.9
-            },
-            "trend": {
-                "keywords": ["tendência", "evolução", "ao longo", "trend", "over time", "temporal", "período"],
-                "importance": 0.85
-            },
-            "distribution": {
-                "keywords": ["distribuição", "frequência", "histogram", "distribution", "frequency", "percentual"],
-                "importance": 0.75
-            },
-            "correlation": {
-                "keywords": ["correlação", "relação", "correlation", "relationship", "dependência", "influência"],
-                "importance": 0.9
-            }
+            intent: {"keywords": INTENT_KEYWORDS[intent], "importance": importance}
+            for intent, importance in intent_importance.items()
         }
 
     def _handle_message(self, message: AgentMessage) -> Optional[AgentMessage]:
@@ -119,20 +109,21 @@ class QueryAnalyzerAgent(BaseAgent):
     
     def _analyze_query_intent(self, question: str, data_type: str) -> Dict[str, Any]:
         """Analisa a intenção da consulta com pesos e confiança ajustada"""
-        question_lower = question.lower()
+        # Uma única passada sobre a pergunta, compartilhada com os demais agentes
+        matches = match_question(question)
         detected_intents = []
         confidence_scores = []
         
         # Análise por padrões e keywords com pesos
         for intent, config in self.intent_patterns.items():
-            matched_keywords = [k for k in config["keywords"] if k in question_lower]
+            matched_keywords = matches.matched(f"intent:{intent}")
             if matched_keywords:
                 score = len(matched_keywords) * config["importance"]
                 detected_intents.append(intent)
                 confidence_scores.append(score)
 
         # Determinar complexidade com mais nuances
-        complexity = self._determine_complexity(question_lower, detected_intents)
+        complexity = self._determine_complexity(matches, detected_intents)
         
         # Calcular confiança global
         avg_confidence = sum(confidence_scores) / len(confidence_scores) if confidence_scores else 0.5
@@ -148,29 +139,24 @@ class QueryAnalyzerAgent(BaseAgent):
             "requires_sql": data_type == "database",
             "requires_pandas": data_type == "dataframe",
             "confidence": final_confidence,
-            "context_indicators": self._extract_context_indicators(question_lower)
+            "context_indicators": self._extract_context_indicators(matches)
         }
 
-    def _determine_complexity(self, question: str, intents: List[str]) -> str:
+    def _determine_complexity(self, matches: QuestionMatches, intents: List[str]) -> str:
         """Determina a complexidade da consulta com mais critérios"""
-        if len(intents) <= 1 and len(question.split()) < 10:
+        if len(intents) <= 1 and matches.word_count < 10:
             return "simple"
             
-        if any(word in question for word in [
-            "múltiplas", "várias", "complex", "advanced", "relacionar", 
-            "combinar", "agrupar", "categorizar", "analisar"
-        ]) or len(intents) >= 3:
+        if matches.has("complexity") or len(intents) >= 3:
             return "complex"
             
         return "medium"
 
-    def _extract_context_indicators(self, question: str) -> Dict[str, Any]:
+    def _extract_context_indicators(self, matches: QuestionMatches) -> Dict[str, Any]:
         """Extrai indicadores de contexto da pergunta"""
         return {
-            "temporal": any(word in question for word in ["quando", "data", "período", "mês", "ano"]),
-            "comparative": any(word in question for word in ["mais", "menos", "maior", "menor", "igual"]),
-            "categorical": any(word in question for word in ["tipo", "categoria", "classe", "grupo"]),
-            "numeric": any(word in question for word in ["quantidade", "valor", "número", "total"])
+            indicator: matches.has(f"context:{indicator}")
+            for indicator in ("temporal", "comparative", "categorical", "numeric")
         }
 
 class SQLGeneratorAgent(BaseAgent):
@@ -216,11 +202,12 @@ class SQLGeneratorAgent(BaseAgent):
         intents = analysis.get("intents", [])
         
         if "aggregation" in intents:
-            if any(word in question.lower() for word in ["média", "average"]):
+            matches = match_question(question)
+            if matches.has("operation:average"):
                 return "SELECT AVG(column_name) FROM table_name"
-            elif any(word in question.lower() for word in ["total", "soma", "sum"]):
+            elif matches.has("operation:total"):
                 return "SELECT SUM(column_name) FROM table_name"
-            elif any(word in question.lower() for word in ["count", "quantidade"]):
+            elif matches.has("operation:count"):
                 return "SELECT COUNT(*) FROM table_name"
         
         # SQL padrão para consultas simples
@@ -228,28 +215,17 @@ class SQLGeneratorAgent(BaseAgent):
     
     def _validate_sql_query(self, sql_query: str) -> Dict[str, Any]:
         """Valida a consulta SQL gerada"""
-        # Validações básicas de segurança
-        dangerous_keywords = ["DROP", "DELETE", "INSERT", "UPDATE", "ALTER", "CREATE"]
-        
-        sql_upper = sql_query.upper()
-        for keyword in dangerous_keywords:
-            if keyword in sql_upper:
-                return {
-                    "is_valid": False,
-                    "error": f"Operação SQL perigosa detectada: {keyword}",
-                    "severity": "high"
-                }
-        
-        # Verificar se é uma consulta SELECT
-        if not sql_upper.strip().startswith("SELECT"):
+        verdict = sql_validator.validate(sql_query)
+        if not verdict.is_valid:
             return {
                 "is_valid": False,
-                "error": "Apenas consultas SELECT são permitidas",
-                "severity": "medium"
+                "error": verdict.error,
+                "severity": verdict.severity
             }
         
         return {
             "is_valid": True,
+            "normalized_sql": verdict.normalized,
             "confidence": 0.9,
             "estimated_complexity": "medium"
         }
@@ -291,11 +267,12 @@ class DataInterpreterAgent(BaseAgent):
         intents = analysis.get("intents", [])
         
         if "aggregation" in intents:
-            if any(word in question.lower() for word in ["média", "average"]):
+            matches = match_question(question)
+            if matches.has("operation:average"):
                 return "df.mean()"
-            elif any(word in question.lower() for word in ["total", "soma", "sum"]):
+            elif matches.has("operation:total"):
                 return "df.sum()"
-            elif any(word in question.lower() for word in ["count", "quantidade"]):
+            elif matches.has("operation:count"):
                 return "df.count()"
         
         if "distribution" in intents:
@@ -343,11 +320,12 @@ class ResultSynthesizerAgent(BaseAgent):
         # Esta é uma implementação simplificada
         # Em um sistema real, usaria um LLM para gerar respostas mais naturais
         
-        if "média" in question.lower() or "average" in question.lower():
+        matches = match_question(question)
+        if matches.has("operation:average"):
             return f"Para calcular a média solicitada, utilizei o seguinte código: {code}"
-        elif "total" in question.lower() or "soma" in question.lower():
+        elif matches.has("operation:total"):
             return f"Para obter o total solicitado, executei: {code}"
-        elif "count" in question.lower() or "quantidade" in question.lower():
+        elif matches.has("operation:count"):
             return f"Para contar os registros, utilizei: {code}"
         
         return f"Baseado na sua pergunta, executei o seguinte código: {code}"
@@ -0,0 +1,251 @@
+# backend/app/answer_cache.py
+
+import os
+import re
+import json
+import time
+import hashlib
+import sqlite3
+import threading
+import unicodedata
+import logging
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Dict, Any, Optional
+
+import pandas as pd
+
+# Configurar logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+def normalize_question(question: str) -> str:
+    """Normaliza a pergunta: minúsculas, sem acentos, pontuação e espaços extras."""
+    text = unicodedata.normalize("NFKD", question.lower())
+    text = "".join(ch for ch in text if not unicodedata.combining(ch))
+    text = re.sub(r"[^\w\s]", " ", text)
+    return re.sub(r"\s+", " ", text).strip()
+
+def dataframe_fingerprint(df: pd.DataFrame) -> str:
+    """Hash do conteúdo do DataFrame (valores, colunas e tipos)."""
+    digest = hashlib.sha256()
+    digest.update(json.dumps([str(c) for c in df.columns]).encode())
+    digest.update(json.dumps([str(t) for t in df.dtypes]).encode())
+    digest.update(pd.util.hash_pandas_object(df, index=True).to_numpy().tobytes())
+    return digest.hexdigest()
+
+def database_fingerprint(db_path: str, tables: Optional[list] = None) -> str:
+    """Identifica o estado do arquivo SQLite pelo caminho, tamanho e data de modificação."""
+    parts = [os.path.abspath(db_path), json.dumps(sorted(tables or []))]
+    for path in (db_path, f"{db_path}-wal"):
+        if os.path.exists(path):
+            stat = os.stat(path)
+            parts.append(f"{stat.st_size}:{stat.st_mtime_ns}")
+    return hashlib.sha256("|".join(parts).encode()).hexdigest()
+
+def session_fingerprint(session_data: Dict[str, Any]) -> Optional[str]:
+    """
+    Fingerprint dos dados da sessão. Para DataFrames o hash é guardado na sessão
+    e recalculado apenas quando o DataFrame muda.
+    """
+    if session_data.get("type") == "dataframe":
+        df = session_data.get("dataframe")
+        if df is None:
+            return None
+        if session_data.get("fingerprint_dataframe") is not df:
+            session_data["data_fingerprint"] = dataframe_fingerprint(df)
+            session_data["fingerprint_dataframe"] = df
+        return session_data["data_fingerprint"]
+    if session_data.get("type") == "database" and session_data.get("db_path"):
+        return database_fingerprint(session_data["db_path"], session_data.get("tables"))
+    return None
+
+def schema_signature(session_data: Dict[str, Any]) -> Optional[str]:
+    """
+    Assinatura do schema da sessão (colunas e tipos), independente do conteúdo.
+    Guardada na sessão e recalculada apenas quando o DataFrame ou a versão do
+    schema do banco mudam.
+    """
+    if session_data.get("type") == "dataframe":
+        df = session_data.get("dataframe")
+        if df is None:
+            return None
+        if session_data.get("signature_dataframe") is not df:
+            schema = [[str(c), str(t)] for c, t in df.dtypes.items()]
+            session_data["schema_signature"] = hashlib.sha256(json.dumps(schema).encode()).hexdigest()
+            session_data["signature_dataframe"] = df
+        return session_data["schema_signature"]
+    if session_data.get("type") == "database" and session_data.get("engine_instance") is not None:
+        from app.schema_catalog import schema_catalog, describe_tables
+        version = schema_catalog.get(session_data["engine_instance"])["version"]
+        if "schema_signature" not in session_data or session_data.get("signature_version") != version:
+            columns = describe_tables(session_data["engine_instance"], session_data.get("tables"))
+            schema = {
+                table: [[col["name"], col["type"]] for col in columns.get(table, [])]
+                for table in sorted(session_data.get("tables", []))
+            }
+            session_data["schema_signature"] = hashlib.sha256(json.dumps(schema).encode()).hexdigest()
+            session_data["signature_version"] = version
+        return session_data["schema_signature"]
+    return None
+
+class AnswerCache:
+    """
+    Cache de respostas por pergunta normalizada + fingerprint dos dados.
+
+    Mantém um nível em memória (LRU com TTL) e, opcionalmente, um nível em
+    disco (SQLite) compartilhado entre reinícios e workers.
+    """
+
+    def __init__(self,
+                 max_entries: Optional[int] = None,
+                 ttl_seconds: Optional[int] = None,
+                 cache_dir: Optional[str] = None,
+                 db_name: str = "answer_cache.db"):
+        if max_entries is None:
+            max_entries = int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", 1000))
+        if ttl_seconds is None:
+            ttl_seconds = int(os.getenv("ANSWER_CACHE_TTL_SECONDS", 3600))
+        if cache_dir is None:
+            cache_dir = os.getenv("ANSWER_CACHE_DIR", "")
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.db_path = os.path.join(cache_dir, db_name) if cache_dir else None
+        self._entries: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        if self.db_path:
+            os.makedirs(cache_dir, exist_ok=True)
+            with self._connect() as conn:
+                conn.execute("PRAGMA journal_mode=WAL")
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS answers (key TEXT PRIMARY KEY, value TEXT NOT NULL, created_at REAL NOT NULL)"
+                )
+
+    @contextmanager
+    def _connect(self):
+        """Abre uma conexão curta; confirma a transação e fecha ao final."""
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def make_key(self, question: str, fingerprint: str) -> str:
+        return hashlib.sha256(f"{normalize_question(question)}\x00{fingerprint}".encode()).hexdigest()
+
+    def _is_expired(self, created_at: float, now: float) -> bool:
+        return self.ttl_seconds > 0 and now - created_at > self.ttl_seconds
+
+    def get(self, question: str, fingerprint: Optional[str]) -> Optional[Dict[str, Any]]:
+        """Retorna a resposta em cache ou None."""
+        if fingerprint is None:
+            return None
+        return self.get_by_key(self.make_key(question, fingerprint))
+
+    def get_by_key(self, key: str) -> Optional[Dict[str, Any]]:
+        """Busca por uma chave já montada pelo chamador (sem normalizar pergunta)."""
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if not self._is_expired(entry["created_at"], now):
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return entry["value"]
+                del self._entries[key]
+
+        if self.db_path:
+            try:
+                with self._connect() as conn:
+                    row = conn.execute("SELECT value, created_at FROM answers WHERE key = ?", (key,)).fetchone()
+                    if row is not None and self._is_expired(row[1], now):
+                        conn.execute("DELETE FROM answers WHERE key = ?", (key,))
+                        row = None
+            except sqlite3.Error as e:
+                logger.warning(f"Falha ao ler o cache de respostas em disco: {e}")
+                row = None
+            if row is not None:
+                value = json.loads(row[0])
+                with self._lock:
+                    self._store(key, value, row[1])
+                    self.hits += 1
+                    self.disk_hits += 1
+                return value
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def set(self, question: str, fingerprint: Optional[str], value: Dict[str, Any]):
+        """Armazena uma resposta (deve ser serializável em JSON)."""
+        if fingerprint is None:
+            return
+        self.set_by_key(self.make_key(question, fingerprint), value)
+
+    def set_by_key(self, key: str, value: Dict[str, Any]):
+        """Armazena um valor sob uma chave já montada pelo chamador."""
+        now = time.time()
+        with self._lock:
+            self._store(key, value, now)
+        if self.db_path:
+            try:
+                with self._connect() as conn:
+                    conn.execute(
+                        "INSERT OR REPLACE INTO answers VALUES (?, ?, ?)",
+                        (key, json.dumps(value, ensure_ascii=False, default=str), now)
+                    )
+            except sqlite3.Error as e:
+                logger.warning(f"Falha ao gravar o cache de respostas em disco: {e}")
+
+    def _store(self, key: str, value: Dict[str, Any], created_at: float):
+        self._entries[key] = {"value": value, "created_at": created_at}
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+        if self.db_path:
+            with self._connect() as conn:
+                conn.execute("DELETE FROM answers")
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl_seconds,
+            "disk_tier": self.db_path,
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions
+        }
+
+# Instância global do cache de respostas
+answer_cache = AnswerCache()
+
+# Cache do código gerado (Pandas/SQL), chaveado pela assinatura do schema:
+# dados novos com o mesmo schema reaproveitam o código sem chamar o LLM
+code_cache = AnswerCache(
+    max_entries=int(os.getenv("CODE_CACHE_MAX_ENTRIES", 1000)),
+    ttl_seconds=int(os.getenv("CODE_CACHE_TTL_SECONDS", 7 * 24 * 3600)),
+    cache_dir=os.getenv("ANSWER_CACHE_DIR", ""),
+    db_name="code_cache.db"
+)
+
+def get_answer_cache() -> AnswerCache:
+    """Dependency para obter o cache de respostas"""
+    return answer_cache
+
+def get_code_cache() -> AnswerCache:
+    """Dependency para obter o cache de código gerado"""
+    return code_cache
@@ -1,45 +1,230 @@
 # backend/app/data_loader.py
 
+import os
+import csv
+import tempfile
 import pandas as pd
 import numpy as np
 from fastapi import UploadFile, HTTPException
 import io
 import logging
-from typing import Dict, Any
+from typing import Dict, Any, Optional, Tuple, List
+
+from app.security import security_manager
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-async def load_dataframe_from_file(file: UploadFile) -> pd.DataFrame:
-    """Carrega e pré-processa um DataFrame a partir de um arquivo."""
+# Tamanho dos blocos lidos do upload e número de linhas por bloco do parser CSV
+UPLOAD_CHUNK_SIZE = 1024 * 1024  # 1MB
+CSV_CHUNK_ROWS = 100_000
+# Quantidade de bytes do início do arquivo usada para detectar o dialeto do CSV
+SNIFF_SAMPLE_SIZE = 64 * 1024
+CSV_DELIMITERS = [',', ';', '\t', '|']
+# Colunas de texto com proporção de valores distintos até este limite viram 'category'
+CATEGORY_MAX_UNIQUE_RATIO = 0.5
+
+NA_VALUES = ['', 'nan', 'NaN', 'null', 'None', 'NA']  # Lista expandida de valores nulos
+
+async def spool_upload_to_disk(file: UploadFile, max_bytes: Optional[int] = None) -> str:
+    """
+    Copia o upload em blocos para um arquivo temporário, sem carregar o corpo
+    inteiro em memória. O limite de tamanho é verificado a cada bloco recebido.
+
+    Returns:
+        Caminho do arquivo temporário (o chamador é responsável por removê-lo)
+    """
+    if max_bytes is None:
+        max_bytes = security_manager.max_file_size
+
+    # Rejeitar cedo quando o tamanho já é conhecido
+    if file.size is not None and file.size > max_bytes:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Arquivo muito grande. Tamanho máximo: {max_bytes // (1024*1024)}MB"
+        )
+
+    suffix = os.path.splitext(file.filename or "")[1].lower()
+    tmp = tempfile.NamedTemporaryFile(prefix="upload_", suffix=suffix, delete=False)
+    total = 0
+    try:
+        with tmp:
+            while True:
+                chunk = await file.read(UPLOAD_CHUNK_SIZE)
+                if not chunk:
+                    break
+                total += len(chunk)
+                if total > max_bytes:
+                    raise HTTPException(
+                        status_code=413,
+                        detail=f"Arquivo muito grande. Tamanho máximo: {max_bytes // (1024*1024)}MB"
+                    )
+                tmp.write(chunk)
+    except Exception:
+        os.remove(tmp.name)
+        raise
+
+    logger.info(f"Upload {file.filename} gravado em disco ({total} bytes)")
+    return tmp.name
+
+def read_csv_in_chunks(path: str, **read_kwargs) -> pd.DataFrame:
+    """Lê um CSV em blocos de linhas e monta o DataFrame incrementalmente."""
+    chunks = []
+    with pd.read_csv(path, chunksize=CSV_CHUNK_ROWS, **read_kwargs) as reader:
+        for chunk in reader:
+            # Descartar linhas vazias por bloco reduz o que é mantido em memória
+            chunk = chunk.dropna(how='all')
+            if not chunk.empty:
+                chunks.append(chunk)
+    if not chunks:
+        return pd.DataFrame()
+    if len(chunks) == 1:
+        return chunks[0]
+    return pd.concat(chunks, ignore_index=True)
+
+def _detect_encoding(sample: bytes) -> str:
+    """Detecta o encoding da amostra (UTF-8 com ou sem BOM, senão latin1)."""
+    if sample.startswith(b'\xef\xbb\xbf'):
+        return 'utf-8-sig'
+    try:
+        sample.decode('utf-8')
+        return 'utf-8'
+    except UnicodeDecodeError as e:
+        # A amostra pode ter cortado um caractere multibyte no final
+        if e.start >= len(sample) - 3 and e.reason == 'unexpected end of data':
+            return 'utf-8'
+        return 'latin1'
+
+def _looks_numeric(value: str) -> bool:
+    try:
+        float(value.replace(',', '.'))
+        return True
+    except ValueError:
+        return False
+
+def sniff_csv_dialect(path: str, sample_size: int = SNIFF_SAMPLE_SIZE) -> Dict[str, Any]:
+    """
+    Detecta encoding, delimitador, caractere de aspas e presença de cabeçalho
+    a partir de uma amostra do início do arquivo.
+    """
+    with open(path, 'rb') as f:
+        raw = f.read(sample_size)
+
+    encoding = _detect_encoding(raw)
+    text_sample = raw.decode(encoding, errors='ignore')
+    # Descartar a última linha, que pode estar incompleta
+    lines = text_sample.splitlines()
+    if len(raw) == sample_size and len(lines) > 1:
+        lines = lines[:-1]
+    text_sample = '\n'.join(lines)
+
+    delimiter = ','
+    quotechar = '"'
+    try:
+        sniffed = csv.Sniffer().sniff(text_sample, delimiters=''.join(CSV_DELIMITERS))
+        delimiter = sniffed.delimiter
+        quotechar = sniffed.quotechar or '"'
+    except csv.Error:
+        # Sniffer não conclusivo: escolher o delimitador mais frequente na primeira linha
+        first_line = lines[0] if lines else ''
+        counts = {d: first_line.count(d) for d in CSV_DELIMITERS}
+        best = max(counts, key=counts.get)
+        if counts[best] > 0:
+            delimiter = best
+
+    # Considerar que há cabeçalho, a menos que a primeira linha seja toda numérica
+    has_header = True
+    if lines:
+        first_row = next(csv.reader([lines[0]], delimiter=delimiter, quotechar=quotechar), [])
+        values = [v.strip() for v in first_row if v.strip()]
+        if values and all(_looks_numeric(v) for v in values):
+            has_header = False
+
+    dialect = {
+        "encoding": encoding,
+        "delimiter": delimiter,
+        "quotechar": quotechar,
+        "has_header": has_header
+    }
+    logger.info(f"Dialeto CSV detectado: {dialect}")
+    return dialect
+
+def read_columnar_file(path: str, columns: Optional[List[str]] = None) -> pd.DataFrame:
+    """
+    Lê arquivos Parquet ou Arrow IPC/Feather com pyarrow.
+
+    O arquivo é mapeado em memória e apenas as colunas pedidas são lidas.
+    A conversão para pandas evita cópias quando os tipos permitem.
+    """
+    import pyarrow as pa
+    import pyarrow.ipc as ipc
+    import pyarrow.feather as feather
+    import pyarrow.parquet as pq
+
+    if path.endswith('.parquet'):
+        table = pq.read_table(path, columns=columns, memory_map=True)
+    elif path.endswith('.feather'):
+        table = feather.read_table(path, columns=columns, memory_map=True)
+    else:
+        # Os buffers da tabela mantêm o mapeamento vivo depois de fechar o arquivo
+        with pa.memory_map(path, 'r') as source:
+            try:
+                table = ipc.open_file(source).read_all()
+            except pa.ArrowInvalid:
+                # Formato de stream IPC (sem footer)
+                source.seek(0)
+                table = ipc.open_stream(source).read_all()
+        if columns:
+            table = table.select(columns)
+
+    # split_blocks/self_destruct evitam consolidar colunas em blocos novos
+    return table.to_pandas(split_blocks=True, self_destruct=True)
+
+async def load_dataframe_from_file(file: UploadFile,
+                                   compact: bool = False,
+                                   columns: Optional[List[str]] = None) -> Tuple[pd.DataFrame, Dict[str, Any]]:
+    """
+    Carrega e pré-processa um DataFrame a partir de um arquivo.
+
+    Args:
+        file: Arquivo enviado
+        compact: Se deve reduzir os tipos de dados para economizar memória
+        columns: Colunas a carregar (apenas Parquet e Arrow IPC/Feather)
+
+    Returns:
+        Tupla (DataFrame, informações da carga, como o dialeto CSV detectado)
+    """
+    path = None
     try:
-        content = await file.read()
+        path = await spool_upload_to_disk(file)
         df = None
+        load_info: Dict[str, Any] = {}
         
         if file.filename.endswith('.csv'):
-            # Tentar diferentes encodings e delimitadores
-            for encoding in ['utf-8', 'latin1', 'iso-8859-1']:
-                for delimiter in [',', ';', '\t']:
-                    try:
-                        df = pd.read_csv(
-                            io.BytesIO(content),
-                            encoding=encoding,
-                            sep=delimiter,
-                            na_values=['', 'nan', 'NaN', 'null', 'None', 'NA'],  # Lista expandida de valores nulos
-                            keep_default_na=True
-                        )
-                        if len(df.columns) > 1:
-                            break
-                    except Exception as e:
-                        logger.warning(f"Tentativa falhou com encoding {encoding} e delimiter {delimiter}: {e}")
-                        continue
-                if df is not None and len(df.columns) > 1:
-                    break
+            # Detectar o dialeto a partir de uma amostra e ler o arquivo uma única vez
+            dialect = sniff_csv_dialect(path)
+            load_info["dialect"] = dialect
+            read_kwargs = dict(
+                sep=dialect["delimiter"],
+                quotechar=dialect["quotechar"],
+                header=0 if dialect["has_header"] else None,
+                na_values=NA_VALUES,
+                keep_default_na=True
+            )
+            try:
+                df = read_csv_in_chunks(path, encoding=dialect["encoding"], **read_kwargs)
+            except UnicodeDecodeError as e:
+                # A amostra era UTF-8 válido, mas o restante do arquivo não
+                logger.warning(f"Falha ao decodificar {file.filename} como {dialect['encoding']}, usando latin1: {e}")
+                dialect["encoding"] = "latin1"
+                df = read_csv_in_chunks(path, encoding="latin1", **read_kwargs)
         
         elif file.filename.endswith(('.xls', '.xlsx')):
-            df = pd.read_excel(io.BytesIO(content), na_values=['', 'nan', 'NaN', 'null', 'None', 'NA'])
+            df = pd.read_excel(path, na_values=NA_VALUES)
         elif file.filename.endswith('.json'):
-            df = pd.read_json(io.BytesIO(content))
+            df = pd.read_json(path)
+        elif file.filename.endswith(('.parquet', '.arrow', '.feather', '.ipc')):
+            df = read_columnar_file(path, columns=columns)
         else:
             raise ValueError(f"Formato de arquivo não suportado: {file.filename}")
 
@@ -49,48 +234,136 @@ async def load_dataframe_from_file(file: UploadFile) -> pd.DataFrame:
         # Processar e limpar dados
         df = process_dataframe(df)
         
+        if compact:
+            df, load_info["memory"] = compact_dataframe(df)
+        
         logger.info(f"DataFrame carregado com sucesso. Shape: {df.shape}")
         logger.info(f"Colunas: {df.columns.tolist()}")
         logger.info(f"Tipos de dados: {df.dtypes.to_dict()}")
         
-        return df
+        return df, load_info
 
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Erro ao carregar arquivo {file.filename}: {str(e)}")
         raise HTTPException(status_code=400, detail=f"Erro ao processar arquivo: {str(e)}")
+    finally:
+        if path is not None and os.path.exists(path):
+            os.remove(path)
+
+def _coerce_numeric(series: pd.Series) -> pd.Series:
+    """
+    Converte para numérico; valores não conversíveis viram NaN.
+
+    Apenas os valores distintos são convertidos e o resultado é expandido
+    pelos códigos, o que evita reprocessar textos repetidos.
+    """
+    try:
+        codes, uniques = pd.factorize(series, use_na_sentinel=True)
+        converted = pd.to_numeric(pd.Series(uniques, dtype=object), errors='coerce').to_numpy()
+    except (TypeError, ValueError):
+        # Ex.: células com listas/dicts vindas de JSON
+        return pd.Series(np.nan, index=series.index)
+    missing = codes < 0
+    if missing.any():
+        converted = converted.astype('float64', copy=False)
+        values = converted.take(np.where(missing, 0, codes)) if len(converted) else np.full(len(codes), np.nan)
+        values[missing] = np.nan
+    else:
+        values = converted.take(codes)
+    return pd.Series(values, index=series.index, name=series.name)
 
 def process_dataframe(df: pd.DataFrame) -> pd.DataFrame:
-    """Processa e limpa o DataFrame."""
+    """
+    Processa e limpa o DataFrame.
+
+    As etapas são feitas em lote sobre o frame inteiro: uma única passada de
+    nulos, conversão numérica apenas das colunas de texto e um único fillna.
+    """
     # Remover linhas totalmente vazias
     df = df.dropna(how='all')
     
     # Limpar nomes das colunas
     df.columns = [clean_column_name(col) for col in df.columns]
     
-    # Para cada coluna
-    for col in df.columns:
-        # Se a coluna tem mais de 50% de valores nulos, preencher com um valor padrão
-        null_ratio = df[col].isnull().mean()
-        if null_ratio > 0.5:
+    # Avisar sobre colunas com mais de 50% de valores nulos
+    null_counts = df.isnull().sum()
+    if len(df):
+        null_ratios = null_counts / len(df)
+        for col, null_ratio in null_ratios[null_ratios > 0.5].items():
             logger.warning(f"Coluna {col} tem {null_ratio*100:.1f}% de valores nulos")
-            
-        # Tentar converter para numérico se possível
-        if df[col].dtype == 'object':
-            try:
-                numeric_conversion = pd.to_numeric(df[col], errors='coerce')
-                if numeric_conversion.notnull().sum() > df[col].notnull().sum() * 0.5:
-                    df[col] = numeric_conversion
-            except:
-                pass
-        
-        # Preencher valores nulos
-        if df[col].dtype in ['int64', 'float64']:
-            df[col] = df[col].fillna(0)
-        else:
-            df[col] = df[col].fillna("N/A")
+    
+    # Tentar converter para numérico as colunas de texto, todas de uma vez
+    text_cols = df.select_dtypes(include=['object', 'string']).columns
+    if len(text_cols):
+        text_frame = df[text_cols]
+        converted = text_frame.apply(_coerce_numeric)
+        original_notnull = len(df) - null_counts[text_cols]
+        accepted = converted.columns[converted.notnull().sum() > original_notnull * 0.5]
+        if len(accepted):
+            df[accepted] = converted[accepted]
+            null_counts[accepted] = converted[accepted].isnull().sum()
+    
+    # Preencher valores nulos por grupo de colunas, só nas colunas que têm nulos
+    with_nulls = null_counts[null_counts > 0].index
+    if len(with_nulls):
+        dtypes = df.dtypes[with_nulls]
+        numeric_cols = dtypes[dtypes.isin([np.dtype('int64'), np.dtype('float64')])].index
+        other_cols = with_nulls.difference(numeric_cols, sort=False)
+        if len(numeric_cols):
+            df[numeric_cols] = df[numeric_cols].fillna(0)
+        if len(other_cols):
+            df[other_cols] = df[other_cols].fillna("N/A")
     
     return df
 
+def compact_dataframe(df: pd.DataFrame) -> Tuple[pd.DataFrame, Dict[str, int]]:
+    """
+    Reduz o uso de memória do DataFrame sem perder informação.
+
+    - Inteiros são reduzidos ao menor tipo que comporta os valores
+    - Floats inteiros viram inteiros; os demais viram float32 apenas se não houver perda
+    - Textos com poucos valores distintos viram 'category', os demais strings Arrow
+
+    Returns:
+        Tupla (DataFrame compactado, bytes antes e depois)
+    """
+    bytes_before = int(df.memory_usage(deep=True).sum())
+    converted = {}
+
+    for col in df.select_dtypes(include=['integer']).columns:
+        converted[col] = pd.to_numeric(df[col], downcast='integer')
+
+    for col in df.select_dtypes(include=['floating']).columns:
+        values = df[col].to_numpy()
+        if np.isfinite(values).all() and np.array_equal(values, np.floor(values)):
+            converted[col] = pd.to_numeric(df[col], downcast='integer')
+        else:
+            as_float32 = values.astype('float32')
+            if np.array_equal(as_float32.astype(values.dtype), values, equal_nan=True):
+                converted[col] = pd.Series(as_float32, index=df.index, name=col)
+
+    text_cols = df.select_dtypes(include=['object', 'string']).columns
+    if len(text_cols) and len(df):
+        unique_ratios = df[text_cols].nunique() / len(df)
+        for col in text_cols:
+            try:
+                if unique_ratios[col] <= CATEGORY_MAX_UNIQUE_RATIO:
+                    converted[col] = df[col].astype('category')
+                else:
+                    converted[col] = df[col].astype('string[pyarrow]')
+            except (TypeError, ValueError, ImportError) as e:
+                # Colunas com objetos mistos (ex.: listas de JSON) permanecem como estão
+                logger.warning(f"Coluna {col} não pôde ser compactada: {e}")
+
+    if converted:
+        df = df.assign(**{str(col): series for col, series in converted.items()})
+
+    bytes_after = int(df.memory_usage(deep=True).sum())
+    logger.info(f"DataFrame compactado: {bytes_before} -> {bytes_after} bytes")
+    return df, {"bytes_before": bytes_before, "bytes_after": bytes_after}
+
 def clean_column_name(col: str) -> str:
     """Limpa e padroniza nomes de colunas."""
     import re
@@ -1,27 +1,186 @@
 # backend/app/database_security.py
 
 import os
+import io
+import csv
+import json
 import sqlite3
-from typing import Optional, List, Dict, Any
-from sqlalchemy import create_engine, text, inspect
+from typing import Optional, List, Dict, Any, Iterator
+from sqlalchemy import text
 from sqlalchemy.exc import SQLAlchemyError
 from fastapi import HTTPException
 import logging
+import pyarrow as pa
+import pyarrow.compute as pc
+
+from app.engine_registry import get_shared_engine
+from app.schema_catalog import schema_catalog
+from app.sql_validator import sql_validator, READ_ONLY_POLICY
+from app.query_control import current_query
 
 # Configurar logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+RESULT_FORMATS = ("records", "columns", "arrow")
+
+def _to_arrow_array(values: list) -> pa.Array:
+    """
+    Converte os valores de uma coluna. Inteiros, reais, texto e booleanos são
+    mantidos; outros tipos (ou colunas com tipos mistos, possíveis no SQLite)
+    viram texto, como no formato antigo por linhas.
+    """
+    try:
+        array = pa.array(values)
+        if _is_plain_type(array.type):
+            return array
+    except (pa.ArrowInvalid, pa.ArrowTypeError, OverflowError):
+        pass
+    return pa.array([None if value is None else str(value) for value in values], type=pa.string())
+
+def _is_plain_type(arrow_type: pa.DataType) -> bool:
+    return (pa.types.is_integer(arrow_type) or pa.types.is_floating(arrow_type)
+            or pa.types.is_string(arrow_type) or pa.types.is_boolean(arrow_type)
+            or pa.types.is_null(arrow_type))
+
+def rows_to_arrow(columns: List[str], rows: List[Any]) -> pa.Table:
+    """Transpõe um lote de linhas do cursor para uma tabela Arrow."""
+    column_values = list(zip(*rows)) if rows else [() for _ in columns]
+    arrays = [_to_arrow_array(list(values)) for values in column_values]
+    return pa.Table.from_arrays(arrays, names=columns)
+
+def empty_arrow_table(columns: List[str]) -> pa.Table:
+    return pa.Table.from_arrays([pa.array([], type=pa.null()) for _ in columns], names=columns)
+
+def concat_arrow_tables(tables: List[pa.Table]) -> pa.Table:
+    """Junta os lotes, promovendo tipos (ex.: null -> int, int -> double) quando necessário."""
+    try:
+        return pa.concat_tables(tables, promote_options="permissive")
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        # Tipos incompatíveis entre lotes: as colunas divergentes viram texto
+        names = tables[0].column_names
+        conflicting = [
+            i for i, name in enumerate(names)
+            if len({t.schema.field(i).type for t in tables if not pa.types.is_null(t.schema.field(i).type)}) > 1
+        ]
+        converted = []
+        for t in tables:
+            for i in conflicting:
+                t = t.set_column(i, names[i], pc.cast(t.column(i), pa.string()))
+            converted.append(t)
+        return pa.concat_tables(converted, promote_options="permissive")
+
+def arrow_to_columnar_json(table: pa.Table) -> Dict[str, Any]:
+    """Resultado orientado a colunas: nomes, tipos e uma lista de valores por coluna."""
+    return {
+        "columns": table.column_names,
+        "types": [str(field.type) for field in table.schema],
+        "data": {name: table.column(i).to_pylist() for i, name in enumerate(table.column_names)},
+        "row_count": table.num_rows
+    }
+
+def arrow_to_ipc_bytes(table: pa.Table) -> bytes:
+    """Serializa a tabela no formato Arrow IPC (stream)."""
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
+
+STREAM_FORMATS = ("ndjson", "csv", "arrow")
+
+STREAM_MEDIA_TYPES = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv",
+    "arrow": "application/vnd.apache.arrow.stream"
+}
+
+class _NDJSONEncoder:
+    """Uma linha JSON por registro."""
+
+    def encode(self, columns: List[str], rows: List[Any]) -> bytes:
+        return "".join(
+            json.dumps(dict(zip(columns, row)), ensure_ascii=False, default=str) + "\n" for row in rows
+        ).encode("utf-8")
+
+    def finish(self, columns: List[str]) -> bytes:
+        return b""
+
+    def trailer(self, reason: str, rows: int) -> bytes:
+        return (json.dumps({"_truncated": reason, "rows": rows}) + "\n").encode("utf-8")
+
+class _CSVEncoder:
+    """CSV com cabeçalho no primeiro lote."""
+
+    def __init__(self):
+        self.header_sent = False
+
+    def encode(self, columns: List[str], rows: List[Any]) -> bytes:
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        if not self.header_sent:
+            writer.writerow(columns)
+            self.header_sent = True
+        writer.writerows(rows)
+        return buffer.getvalue().encode("utf-8")
+
+    def finish(self, columns: List[str]) -> bytes:
+        # Resultado vazio: envia ao menos o cabeçalho
+        return self.encode(columns, []) if not self.header_sent else b""
+
+    def trailer(self, reason: str, rows: int) -> bytes:
+        # CSV não tem onde sinalizar o corte sem quebrar os leitores
+        return b""
+
+class _ArrowEncoder:
+    """
+    Stream Arrow IPC: o schema vem do primeiro lote (colunas só com nulos viram
+    texto) e os lotes seguintes são convertidos para ele.
+    """
+
+    def __init__(self):
+        self.sink = io.BytesIO()
+        self.writer = None
+        self.schema = None
+
+    def _drain(self) -> bytes:
+        data = self.sink.getvalue()
+        self.sink.seek(0)
+        self.sink.truncate()
+        return data
+
+    def encode(self, columns: List[str], rows: List[Any]) -> bytes:
+        table = rows_to_arrow(columns, rows)
+        if self.writer is None:
+            self.schema = pa.schema([
+                field.with_type(pa.string()) if pa.types.is_null(field.type) else field
+                for field in table.schema
+            ])
+            self.writer = pa.ipc.new_stream(pa.PythonFile(self.sink, mode="w"), self.schema)
+        self.writer.write_table(table.cast(self.schema))
+        return self._drain()
+
+    def finish(self, columns: List[str]) -> bytes:
+        if self.writer is None:
+            self.schema = pa.schema([pa.field(name, pa.string()) for name in columns])
+            self.writer = pa.ipc.new_stream(pa.PythonFile(self.sink, mode="w"), self.schema)
+        self.writer.close()
+        return self._drain()
+
+    def trailer(self, reason: str, rows: int) -> bytes:
+        return b""
+
+_STREAM_ENCODERS = {"ndjson": _NDJSONEncoder, "csv": _CSVEncoder, "arrow": _ArrowEncoder}
+
 class SecureDatabaseConnector:
     """Conector seguro para bancos de dados com proteções contra SQL injection"""
     
     def __init__(self):
         self.max_rows_preview = 100
-        self.allowed_operations = ['SELECT']
-        self.blocked_keywords = [
-            'DROP', 'DELETE', 'INSERT', 'UPDATE', 'ALTER', 'CREATE',
-            'TRUNCATE', 'EXEC', 'EXECUTE', 'GRANT', 'REVOKE'
-        ]
+        self.fetch_batch_size = int(os.getenv("SQL_FETCH_BATCH_SIZE", 10000))
+        self.stream_max_rows = int(os.getenv("SQL_STREAM_MAX_ROWS", 1_000_000))
+        self.stream_max_bytes = int(os.getenv("SQL_STREAM_MAX_MB", 512)) * 1024 * 1024
+        # Apenas SELECT (e WITH ... SELECT), sem escrita/DDL: ver app.sql_validator
+        self.sql_policy = READ_ONLY_POLICY
     
     def create_secure_sqlite_connection(self, db_path: str):
         """Cria conexão segura com SQLite"""
@@ -33,17 +192,8 @@ class SecureDatabaseConnector:
                     detail="Arquivo de banco de dados não encontrado"
                 )
             
-            # Criar engine com configurações de segurança
-            engine = create_engine(
-                f"sqlite:///{db_path}",
-                connect_args={
-                    "check_same_thread": False,
-                    "timeout": 30,  # Timeout de 30 segundos
-                },
-                pool_pre_ping=True,
-                pool_recycle=3600,  # Reciclar conexões a cada hora
-                echo=False  # Não logar SQL em produção
-            )
+            # Engine compartilhada do registro: conexões somente leitura, com timeout e pre-ping
+            engine = get_shared_engine(db_path)
             
             # Testar conexão
             with engine.connect() as conn:
@@ -59,112 +209,149 @@ class SecureDatabaseConnector:
                 detail="Erro ao conectar ao banco de dados"
             )
     
-    def validate_sql_query(self, query: str) -> str:
-        """Valida e sanitiza consulta SQL"""
-        query = query.strip()
-        
-        # Verificar se é uma consulta SELECT
-        if not query.upper().startswith('SELECT'):
-            raise HTTPException(
-                status_code=400,
-                detail="Apenas consultas SELECT são permitidas"
-            )
-        
-        # Verificar palavras-chave bloqueadas
-        query_upper = query.upper()
-        for keyword in self.blocked_keywords:
-            if keyword in query_upper:
-                raise HTTPException(
-                    status_code=400,
-                    detail=f"Operação SQL não permitida: {keyword}"
-                )
+    def validate_sql_query(self, query: str, apply_limit: bool = True) -> str:
+        """
+        Valida e sanitiza consulta SQL. Sem LIMIT explícito, acrescenta o limite
+        de preview, exceto no modo streaming (apply_limit=False), em que os
+        limites de linhas e bytes são aplicados durante a leitura.
+        """
+        verdict = sql_validator.validate(query, self.sql_policy)
+        if not verdict.is_valid:
+            raise HTTPException(status_code=400, detail=verdict.error)
         
-        # Limitar número de resultados
-        if 'LIMIT' not in query_upper:
+        # Limitar número de resultados (LIMIT de subconsultas não conta)
+        query = verdict.normalized
+        if apply_limit and not verdict.has_limit:
             query += f" LIMIT {self.max_rows_preview}"
         
         return query
     
-    def execute_safe_query(self, engine, query: str) -> List[Dict[str, Any]]:
-        """Executa consulta de forma segura"""
+    def execute_safe_query_columnar(self, engine, query: str) -> pa.Table:
+        """
+        Executa consulta de forma segura e monta o resultado em colunas (Arrow),
+        lendo o cursor em lotes de fetch_batch_size linhas.
+        """
         try:
             # Validar consulta
             safe_query = self.validate_sql_query(query)
             
-            # Executar com timeout
             with engine.connect() as conn:
-                result = conn.execute(text(safe_query))
+                # Cursor DB-API direto: tuplas simples, sem o custo dos objetos Row do SQLAlchemy
+                cursor = conn.connection.dbapi_connection.cursor()
+                try:
+                    cursor.execute(safe_query)
+                    columns = [description[0] for description in cursor.description or []]
+                    tables = []
+                    while True:
+                        rows = cursor.fetchmany(self.fetch_batch_size)
+                        if not rows:
+                            break
+                        tables.append(rows_to_arrow(columns, rows))
+                finally:
+                    cursor.close()
                 
-                # Converter para lista de dicionários
-                columns = result.keys()
-                rows = []
-                for row in result.fetchall():
-                    row_dict = {}
-                    for i, value in enumerate(row):
-                        # Tratar valores None e tipos especiais
-                        if value is None:
-                            row_dict[columns[i]] = None
-                        elif isinstance(value, (int, float, str, bool)):
-                            row_dict[columns[i]] = value
-                        else:
-                            row_dict[columns[i]] = str(value)
-                    rows.append(row_dict)
+            table = concat_arrow_tables(tables) if tables else empty_arrow_table(columns)
+            logger.info(f"Consulta executada com sucesso: {table.num_rows} linhas retornadas")
+            return table
                 
-                logger.info(f"Consulta executada com sucesso: {len(rows)} linhas retornadas")
-                return rows
-                
-        except SQLAlchemyError as e:
+        except (SQLAlchemyError, sqlite3.Error) as e:
             logger.error(f"Erro na execução da consulta: {e}")
             raise HTTPException(
                 status_code=500,
                 detail="Erro ao executar consulta no banco de dados"
             )
     
-    def get_table_schema(self, engine, table_name: str) -> Dict[str, Any]:
-        """Obtém schema de uma tabela de forma segura"""
+    def execute_safe_query(self, engine, query: str, output_format: str = "records") -> Any:
+        """
+        Executa consulta de forma segura.
+
+        output_format: "records" (lista de dicionários, formato de compatibilidade),
+        "columns" (JSON orientado a colunas) ou "arrow" (bytes Arrow IPC).
+        """
+        if output_format not in RESULT_FORMATS:
+            raise HTTPException(status_code=400, detail=f"Formato de resultado inválido: {output_format}")
+        table = self.execute_safe_query_columnar(engine, query)
+        if output_format == "columns":
+            return arrow_to_columnar_json(table)
+        if output_format == "arrow":
+            return arrow_to_ipc_bytes(table)
+        return table.to_pylist()
+    
+    def stream_row_limit(self, max_rows: Optional[int] = None) -> int:
+        """
+        Limite de linhas efetivo do streaming: o pedido, entre 1 e
+        SQL_STREAM_MAX_ROWS. Valores ausentes, zero ou negativos usam o máximo
+        (um valor negativo em fetchmany leria a tabela inteira de uma vez).
+        """
+        if not max_rows or max_rows <= 0:
+            return self.stream_max_rows
+        return min(max_rows, self.stream_max_rows)
+    
+    def stream_safe_query(self, engine, query: str, output_format: str = "ndjson",
+                          max_rows: Optional[int] = None, max_bytes: Optional[int] = None) -> Iterator[bytes]:
+        """
+        Executa consulta de forma segura e gera o resultado em pedaços
+        (NDJSON, CSV ou Arrow IPC) enquanto o cursor é lido em lotes, sem
+        carregar o resultado inteiro na memória. A leitura para ao atingir
+        max_rows linhas ou max_bytes bytes; no NDJSON, uma última linha
+        {"_truncated": ...} indica o corte.
+        """
+        if output_format not in STREAM_FORMATS:
+            raise HTTPException(status_code=400, detail=f"Formato de streaming inválido: {output_format}")
+        safe_query = self.validate_sql_query(query, apply_limit=False)
+        max_rows = self.stream_row_limit(max_rows)
+        # Limite de bytes também só pode ser reduzido, nunca desligado
+        max_bytes = self.stream_max_bytes if not max_bytes or max_bytes <= 0 else min(max_bytes, self.stream_max_bytes)
+        encoder = _STREAM_ENCODERS[output_format]()
+        sent_rows = 0
+        sent_bytes = 0
+        truncated = None
+        control = current_query.get()
+
         try:
-            inspector = inspect(engine)
-            
-            # Verificar se a tabela existe
-            if table_name not in inspector.get_table_names():
-                raise HTTPException(
-                    status_code=404,
-                    detail=f"Tabela '{table_name}' não encontrada"
-                )
-            
-            # Obter informações da tabela
-            columns = inspector.get_columns(table_name)
-            indexes = inspector.get_indexes(table_name)
-            
-            schema_info = {
-                "table_name": table_name,
-                "columns": [
-                    {
-                        "name": col["name"],
-                        "type": str(col["type"]),
-                        "nullable": col.get("nullable", True),
-                        "default": col.get("default")
-                    }
-                    for col in columns
-                ],
-                "indexes": [
-                    {
-                        "name": idx["name"],
-                        "columns": idx["column_names"],
-                        "unique": idx.get("unique", False)
-                    }
-                    for idx in indexes
-                ]
-            }
-            
-            return schema_info
-            
-        except SQLAlchemyError as e:
-            logger.error(f"Erro ao obter schema da tabela {table_name}: {e}")
-            raise HTTPException(
-                status_code=500,
-                detail="Erro ao obter informações da tabela"
-            )
+            with engine.connect() as conn:
+                # O cursor fica aberto enquanto o cliente consome o stream
+                cursor = conn.connection.dbapi_connection.cursor()
+                try:
+                    cursor.execute(safe_query)
+                    columns = [description[0] for description in cursor.description or []]
+                    while truncated is None:
+                        rows = cursor.fetchmany(min(self.fetch_batch_size, max_rows - sent_rows))
+                        if not rows:
+                            break
+                        chunk = encoder.encode(columns, rows)
+                        sent_rows += len(rows)
+                        sent_bytes += len(chunk)
+                        yield chunk
+                        if sent_rows >= max_rows:
+                            truncated = "max_rows"
+                        elif sent_bytes >= max_bytes:
+                            truncated = "max_bytes"
+                        elif control is not None and control.should_stop():
+                            truncated = "cancelled" if control.cancelled else "timeout"
+                    # Verifica se havia mais linhas além do limite de linhas
+                    if truncated == "max_rows" and not cursor.fetchone():
+                        truncated = None
+                    yield encoder.finish(columns)
+                finally:
+                    cursor.close()
+        except (SQLAlchemyError, sqlite3.Error, pa.ArrowException) as e:
+            if control is not None and control.should_stop():
+                # Interrompida pelo handler de progresso do SQLite
+                truncated = "cancelled" if control.cancelled else "timeout"
+            else:
+                logger.error(f"Erro durante o streaming da consulta: {e}")
+                truncated = "error"
+
+        if truncated:
+            logger.warning(f"Streaming interrompido ({truncated}) após {sent_rows} linhas e {sent_bytes} bytes")
+            yield encoder.trailer(truncated, sent_rows)
+        else:
+            logger.info(f"Streaming concluído: {sent_rows} linhas, {sent_bytes} bytes")
+    
+    def get_table_schema(self, engine, table_name: str) -> Dict[str, Any]:
+        """Obtém schema de uma tabela a partir do catálogo (sem refletir o banco a cada chamada)"""
+        return schema_catalog.get_table(engine, table_name)
     
     def get_table_preview(self, engine, table_name: str, limit: int = 5) -> Dict[str, Any]:
         """Obtém preview seguro de uma tabela"""
@@ -176,13 +363,13 @@ class SecureDatabaseConnector:
                     detail="Nome de tabela inválido"
                 )
             
+            # Obter schema (do catálogo; 404 se a tabela não existir, sem consultar dados)
+            schema = self.get_table_schema(engine, table_name)
+            
             # Executar consulta segura
             query = f'SELECT * FROM "{table_name}" LIMIT {min(limit, self.max_rows_preview)}'
             rows = self.execute_safe_query(engine, query)
             
-            # Obter schema
-            schema = self.get_table_schema(engine, table_name)
-            
             return {
                 "table_name": table_name,
                 "schema": schema,
@@ -190,6 +377,8 @@ class SecureDatabaseConnector:
                 "row_count": len(rows)
             }
             
+        except HTTPException:
+            raise
         except Exception as e:
             logger.error(f"Erro ao obter preview da tabela {table_name}: {e}")
             raise HTTPException(
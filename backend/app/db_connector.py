@@ -1,31 +1,35 @@
 # backend/app/db_connector.py
 
 import os
-from sqlalchemy import create_engine, inspect, text
+import json
+import hashlib
+import threading
+from collections import OrderedDict
+from sqlalchemy import text
 from sqlalchemy.exc import SQLAlchemyError
 from llama_index.core import SQLDatabase
-from llama_index.llms.openai import OpenAI
 from llama_index.core.indices.struct_store import NLSQLTableQueryEngine
 from fastapi import HTTPException
 import pandas as pd
-from typing import Optional, List
+from typing import Optional, List, Dict, Any, Tuple
 
-# Reutilizar LLM configurado (ou configurar aqui se necessário)
-api_key = os.getenv("OPENAI_API_KEY")
-llm = None
-if api_key:
+from app.llm_registry import get_llm
+from app.engine_registry import get_shared_engine
+from app.answer_cache import AnswerCache, database_fingerprint
+from app.schema_catalog import schema_catalog, describe_tables
+
+def get_sql_llm():
+    """Obtém o LLM compartilhado usado nas consultas SQL (None se não configurado)."""
     try:
-        llm = OpenAI(model="gpt-3.5-turbo", api_key=api_key)
+        return get_llm(model="gpt-3.5-turbo")
     except Exception as e:
         print(f"Erro ao inicializar OpenAI LLM em db_connector: {e}")
-else:
-    print("AVISO: Chave da API OpenAI não encontrada em db_connector.")
+        return None
 
 def get_sqlite_engine(db_path: str):
-    """Cria uma engine SQLAlchemy para um banco de dados SQLite."""
+    """Obtém a engine SQLAlchemy (compartilhada entre sessões) de um banco SQLite."""
     try:
-        # 'check_same_thread=False' é importante para FastAPI/SQLite
-        engine = create_engine(f"sqlite:///{db_path}?check_same_thread=False")
+        engine = get_shared_engine(db_path)
         # Testar conexão
         with engine.connect() as connection:
             print(f"Conexão com SQLite DB em {db_path} bem-sucedida.")
@@ -37,36 +41,55 @@ def get_sqlite_engine(db_path: str):
         print(f"Erro inesperado ao criar engine SQLite: {e}")
         raise HTTPException(status_code=500, detail=f"Erro inesperado ao configurar conexão com banco de dados: {e}")
 
-def get_db_tables_and_preview(engine):
-    """Obtém nomes das tabelas e preview das primeiras linhas de cada uma."""
-    try:
-        inspector = inspect(engine)
-        table_names = inspector.get_table_names()
-        previews = {}
-        with engine.connect() as connection:
-            for table in table_names:
-                # Usar text() para consultas SQL seguras
-                query = text(f'SELECT * FROM "{table}" LIMIT 5')
-                try:
-                    preview_df = pd.read_sql_query(query, connection)
-                    previews[table] = {
-                        "columns": list(preview_df.columns),
-                        "data": preview_df.to_dict(orient='records')
-                    }
-                except Exception as e:
-                    print(f"Erro ao obter preview da tabela {table}: {e}")
-                    previews[table] = {"error": f"Não foi possível obter preview: {e}"}
-        return table_names, previews
-    except SQLAlchemyError as e:
-        print(f"Erro ao inspecionar o banco de dados: {e}")
-        raise HTTPException(status_code=500, detail=f"Erro ao ler metadados do banco de dados: {e}")
+def get_db_tables_and_columns(engine):
+    """Obtém nomes das tabelas e as colunas (nome e tipo) de cada uma, sem ler dados."""
+    entry = schema_catalog.get(engine)
+    return entry["tables"], describe_tables(engine)
 
-def create_sql_query_engine(engine, tables: Optional[List[str]] = None):
-    """Cria um query engine LlamaIndex para um banco de dados SQL."""
+def get_table_preview(engine, table: str, rows: int = 5, offset: int = 0):
+    """Lê uma página de linhas de uma tabela (o nome deve vir da lista de tabelas do banco)."""
+    quoted_table = table.replace('"', '""')
+    query = text(f'SELECT * FROM "{quoted_table}" LIMIT :limit OFFSET :offset')
+    with engine.connect() as connection:
+        preview_df = pd.read_sql_query(query, connection, params={"limit": rows, "offset": offset})
+    return {
+        "columns": list(preview_df.columns),
+        "data": preview_df.to_dict(orient='records'),
+        "rows": rows,
+        "offset": offset
+    }
+
+# Previews por tabela/página, invalidados quando o arquivo do banco muda
+preview_cache = AnswerCache(
+    max_entries=int(os.getenv("PREVIEW_CACHE_MAX_ENTRIES", 2000)),
+    ttl_seconds=int(os.getenv("PREVIEW_CACHE_TTL_SECONDS", 600)),
+    cache_dir=""
+)
+
+def get_cached_table_preview(engine, db_path: str, table: str, rows: int = 5, offset: int = 0):
+    """get_table_preview com cache por tabela, página e estado do arquivo do banco."""
+    key = hashlib.sha256(
+        json.dumps([database_fingerprint(db_path), table, rows, offset]).encode()
+    ).hexdigest()
+    preview = preview_cache.get_by_key(key)
+    if preview is None:
+        try:
+            preview = get_table_preview(engine, table, rows, offset)
+        except Exception as e:
+            print(f"Erro ao obter preview da tabela {table}: {e}")
+            return {"error": f"Não foi possível obter preview: {e}"}
+        preview_cache.set_by_key(key, preview)
+    return preview
+
+def _build_sql_query_engine(engine, tables: Optional[List[str]] = None):
+    llm = get_sql_llm()
     if llm is None:
         raise HTTPException(status_code=500, detail="LLM não configurado para consulta SQL.")
     try:
-        sql_database = SQLDatabase(engine, include_tables=tables)
+        # O SQLDatabase ainda inspeciona o banco e chama reflect() na MetaData
+        # recebida, mas pula as tabelas que ela já contém. Recebe uma cópia: a
+        # MetaData do catálogo é compartilhada entre threads
+        sql_database = SQLDatabase(engine, include_tables=tables, metadata=schema_catalog.copy_metadata(engine))
         # NLSQLTableQueryEngine é adequado para perguntas sobre tabelas específicas
         query_engine = NLSQLTableQueryEngine(
             sql_database=sql_database,
@@ -79,6 +102,86 @@ def create_sql_query_engine(engine, tables: Optional[List[str]] = None):
         print(f"Erro ao criar SQL query engine: {e}")
         raise HTTPException(status_code=500, detail=f"Erro ao inicializar o motor de consulta SQL: {e}")
 
+class SQLQueryEngineCache:
+    """
+    Cache de NLSQLTableQueryEngine por banco (URL da engine) e conjunto de tabelas.
+
+    A reflexão do schema acontece uma vez por banco/tabelas e é compartilhada
+    entre sessões; a entrada é descartada quando a versão do schema no catálogo muda.
+    """
+
+    def __init__(self, max_entries: Optional[int] = None):
+        if max_entries is None:
+            max_entries = int(os.getenv("SQL_QUERY_ENGINE_CACHE_MAX_ENTRIES", 64))
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Tuple[str, str], Dict[str, Any]]" = OrderedDict()
+        self._build_locks: Dict[Tuple[str, str], threading.Lock] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    @staticmethod
+    def make_key(engine, tables: Optional[List[str]]) -> Tuple[str, str]:
+        table_list = json.dumps(sorted(tables) if tables else None)
+        return (engine.url.render_as_string(hide_password=True), hashlib.sha256(table_list.encode()).hexdigest())
+
+    def get(self, engine, tables: Optional[List[str]] = None):
+        """Retorna o query engine em cache, reconstruindo-o se o schema mudou."""
+        key = self.make_key(engine, tables)
+        schema_version = schema_catalog.get(engine)["version"]
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry["schema_version"] == schema_version:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry["query_engine"]
+            build_lock = self._build_locks.setdefault(key, threading.Lock())
+
+        # Uma única reflexão por chave, mesmo com várias sessões pedindo ao mesmo tempo
+        with build_lock:
+            with self._lock:
+                entry = self._entries.get(key)
+                if entry is not None and entry["schema_version"] == schema_version:
+                    self.hits += 1
+                    return entry["query_engine"]
+                if entry is not None:
+                    self.invalidations += 1
+                self.misses += 1
+            print(f"Refletindo schema para o query engine SQL de {key[0]}...")
+            query_engine = _build_sql_query_engine(engine, tables)
+            with self._lock:
+                self._entries[key] = {"query_engine": query_engine, "schema_version": schema_version}
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.max_entries:
+                    evicted, _ = self._entries.popitem(last=False)
+                    self._build_locks.pop(evicted, None)
+            return query_engine
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._build_locks.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "entries": [
+                {"url": url, "tables_hash": tables_hash, "schema_version": entry["schema_version"]}
+                for (url, tables_hash), entry in list(self._entries.items())
+            ],
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "invalidations": self.invalidations
+        }
+
+# Cache global de query engines SQL
+sql_query_engine_cache = SQLQueryEngineCache()
+
+def create_sql_query_engine(engine, tables: Optional[List[str]] = None):
+    """Obtém o query engine LlamaIndex de um banco SQL (compartilhado via cache)."""
+    return sql_query_engine_cache.get(engine, tables)
+
 def query_database_engine(query_engine: NLSQLTableQueryEngine, question: str):
     """
     Executa uma consulta em linguagem natural usando um NLSQLTableQueryEngine.
@@ -103,3 +206,18 @@ def query_database_engine(query_engine: NLSQLTableQueryEngine, question: str):
              error_detail = "Limite de taxa da API OpenAI atingido. Tente novamente mais tarde."
         raise HTTPException(status_code=500, detail=error_detail)
 
+
+def execute_cached_sql(engine, sql: str):
+    """
+    Reexecuta localmente um SQL gerado anteriormente pelo LLM.
+
+    O SQL passa pelas validações do SecureDatabaseConnector (apenas SELECT).
+    """
+    from app.database_security import get_secure_db_connector
+    table = get_secure_db_connector().execute_safe_query_columnar(engine, sql)
+    if table.num_rows == 0:
+        answer = "Nenhum resultado encontrado."
+    else:
+        answer = table.to_pandas().to_string(index=False)
+    print(f"SQL em cache reexecutado: {sql}")
+    return answer, sql
@@ -0,0 +1,143 @@
+# backend/app/engine_registry.py
+
+import os
+import threading
+import logging
+from typing import Dict, Any
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import SQLAlchemyError
+
+from app.query_control import sqlite_progress_handler, SQLITE_PROGRESS_INTERVAL
+
+# Configurar logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+def normalize_sqlite_url(db_path: str) -> str:
+    """URL canônica do banco: caminhos diferentes para o mesmo arquivo geram a mesma chave."""
+    return f"sqlite:///{os.path.realpath(os.path.abspath(db_path))}"
+
+class EngineRegistry:
+    """
+    Registro de engines SQLAlchemy do processo.
+
+    Uma engine (e um pool de conexões) por banco, identificada pela URL
+    normalizada e compartilhada por todas as sessões conectadas ao mesmo
+    arquivo. As conexões são abertas em modo somente leitura (query_only),
+    com os PRAGMAs de desempenho configurados e com um handler de progresso
+    que aplica o prazo/cancelamento da consulta atual (app.query_control).
+    """
+
+    def __init__(self):
+        self.pool_size = int(os.getenv("SQL_POOL_SIZE", 5))
+        self.max_overflow = int(os.getenv("SQL_POOL_MAX_OVERFLOW", 10))
+        self.pool_timeout = int(os.getenv("SQL_POOL_TIMEOUT_SECONDS", 30))
+        self.pool_recycle = int(os.getenv("SQL_POOL_RECYCLE_SECONDS", 3600))
+        self.busy_timeout_ms = int(os.getenv("SQL_BUSY_TIMEOUT_MS", 30000))
+        self.cache_size_kb = int(os.getenv("SQL_CACHE_SIZE_KB", 16384))
+        self.mmap_size = int(os.getenv("SQL_MMAP_SIZE_MB", 256)) * 1024 * 1024
+        # Opcional: altera o cabeçalho do arquivo do usuário e cria os arquivos -wal/-shm
+        self.enable_wal = os.getenv("SQL_ENABLE_WAL", "false").lower() == "true"
+        self._engines: Dict[str, Engine] = {}
+        self._lock = threading.Lock()
+
+    def _configure_connection(self, dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            cursor.execute(f"PRAGMA busy_timeout = {self.busy_timeout_ms}")
+            # Valor negativo: tamanho do cache de páginas em KiB
+            cursor.execute(f"PRAGMA cache_size = -{self.cache_size_kb}")
+            cursor.execute(f"PRAGMA mmap_size = {self.mmap_size}")
+            cursor.execute("PRAGMA temp_store = MEMORY")
+            # As sessões só consultam: qualquer escrita falha na própria conexão
+            cursor.execute("PRAGMA query_only = ON")
+        finally:
+            cursor.close()
+        # Interrompe a consulta quando o prazo da consulta atual expira ou ela é cancelada
+        dbapi_connection.set_progress_handler(sqlite_progress_handler, SQLITE_PROGRESS_INTERVAL)
+
+    def _enable_wal(self, engine: Engine, url: str, db_path: str):
+        # journal_mode é persistente no arquivo; com WAL leitores não bloqueiam o escritor.
+        # Só com SQL_ENABLE_WAL=true e se o arquivo e o diretório (onde ficam -wal/-shm)
+        # puderem ser escritos
+        path = os.path.realpath(db_path)
+        if not (os.access(path, os.W_OK) and os.access(os.path.dirname(path), os.W_OK)):
+            logger.info(f"WAL não ativado em {url}: arquivo ou diretório sem permissão de escrita")
+            return
+        try:
+            raw = engine.raw_connection()
+            try:
+                cursor = raw.cursor()
+                cursor.execute("PRAGMA query_only = OFF")
+                mode = cursor.execute("PRAGMA journal_mode = WAL").fetchone()[0]
+                cursor.execute("PRAGMA query_only = ON")
+                cursor.close()
+            finally:
+                raw.close()
+            logger.info(f"journal_mode de {url}: {mode}")
+        except Exception as e:
+            logger.warning(f"Não foi possível ativar WAL em {url}: {e}")
+
+    def get(self, db_path: str) -> Engine:
+        """Retorna a engine compartilhada do banco, criando-a na primeira chamada."""
+        url = normalize_sqlite_url(db_path)
+        engine = self._engines.get(url)
+        if engine is not None:
+            return engine
+        with self._lock:
+            engine = self._engines.get(url)
+            if engine is None:
+                logger.info(f"Criando engine SQL compartilhada para {url}")
+                engine = create_engine(
+                    url,
+                    connect_args={"check_same_thread": False, "timeout": self.busy_timeout_ms / 1000},
+                    pool_size=self.pool_size,
+                    max_overflow=self.max_overflow,
+                    pool_timeout=self.pool_timeout,
+                    pool_recycle=self.pool_recycle,
+                    pool_pre_ping=True
+                )
+                event.listen(engine, "connect", self._configure_connection)
+                if self.enable_wal:
+                    self._enable_wal(engine, url, db_path)
+                self._engines[url] = engine
+            return engine
+
+    def stats(self) -> Dict[str, Any]:
+        """Ocupação do pool de cada engine, para dimensionar SQL_POOL_SIZE."""
+        engines = []
+        for url, engine in list(self._engines.items()):
+            pool = engine.pool
+            engines.append({
+                "url": url,
+                "pool_size": pool.size(),
+                "checked_out": pool.checkedout(),
+                "checked_in": pool.checkedin(),
+                "overflow": pool.overflow(),
+                "status": pool.status()
+            })
+        return {
+            "engines": engines,
+            "pool_size": self.pool_size,
+            "max_overflow": self.max_overflow,
+            "pool_timeout_seconds": self.pool_timeout
+        }
+
+    def clear(self):
+        """Fecha os pools de todas as engines."""
+        with self._lock:
+            for engine in self._engines.values():
+                try:
+                    engine.dispose()
+                except SQLAlchemyError as e:
+                    logger.warning(f"Erro ao descartar engine: {e}")
+            self._engines.clear()
+
+# Instância global do registro de engines
+engine_registry = EngineRegistry()
+
+def get_shared_engine(db_path: str) -> Engine:
+    """Atalho para obter a engine compartilhada de um banco SQLite"""
+    return engine_registry.get(db_path)
@@ -8,8 +8,12 @@ import logging
 from datetime import datetime
 
 from app.ai_agents import MultiAgentOrchestrator, get_multi_agent_orchestrator
-from app.query_engine import query_dataframe, create_sql_query_engine, query_database_engine
+from app.keyword_matcher import match_question
+from app.query_engine import query_dataframe
+from app.db_connector import create_sql_query_engine, query_database_engine
 from app.database_security import SecureDatabaseConnector, get_secure_db_connector
+from app.schema_catalog import describe_tables
+from app.answer_cache import AnswerCache, get_answer_cache, session_fingerprint
 
 # Configurar logging
 logging.basicConfig(level=logging.INFO)
@@ -21,7 +25,7 @@ class EnhancedQueryEngine:
     def __init__(self):
         self.orchestrator = get_multi_agent_orchestrator()
         self.db_connector = get_secure_db_connector()
-        self.query_cache: Dict[str, Any] = {}
+        self.query_cache: AnswerCache = get_answer_cache()
         self.performance_metrics: List[Dict[str, Any]] = []
         
     def process_intelligent_query(self, 
@@ -42,6 +46,19 @@ class EnhancedQueryEngine:
         start_time = datetime.now()
         
         try:
+            # Responder do cache quando a mesma pergunta já foi feita sobre os mesmos dados
+            fingerprint = session_fingerprint(session_data)
+            cached = self.query_cache.get(question, fingerprint)
+            if cached is not None:
+                final_result = {
+                    **cached,
+                    "execution_time": (datetime.now() - start_time).total_seconds(),
+                    "method": "cache",
+                    "success": True
+                }
+                self._record_performance_metrics(question, final_result, start_time)
+                return final_result
+
             # Determinar tipo de dados
             data_type = session_data.get("type", "unknown")
             
@@ -74,6 +91,14 @@ class EnhancedQueryEngine:
                 # Usar método tradicional diretamente
                 final_result = self._fallback_to_traditional_query(question, session_data, start_time)
             
+            if final_result.get("success"):
+                # Mesmo formato das entradas gravadas por /query (app.main._store_query_result)
+                self.query_cache.set(question, fingerprint, {
+                    "answer": final_result.get("answer", ""),
+                    "generated_code": final_result.get("generated_code", ""),
+                    "sql_equivalent": final_result.get("sql_equivalent")
+                })
+            
             # Registrar métricas de performance
             self._record_performance_metrics(question, final_result, start_time)
             
@@ -110,6 +135,9 @@ class EnhancedQueryEngine:
                 "tables": session_data.get("tables", []),
                 "db_path": session_data.get("db_path", "")
             })
+            engine = session_data.get("engine_instance")
+            if engine is not None:
+                context["schema"] = describe_tables(engine, session_data.get("tables"))
         
         return context
     
@@ -129,7 +157,7 @@ class EnhancedQueryEngine:
                 )
                 
                 # Executar consulta refinada
-                answer, code = query_dataframe(df, refined_question)
+                answer, code, _ = query_dataframe(df, refined_question)
                 
             elif session_data["type"] == "database":
                 # Obter engine SQL
@@ -196,7 +224,7 @@ class EnhancedQueryEngine:
         try:
             if session_data["type"] == "dataframe":
                 df = session_data["dataframe"]
-                answer, generated_code = query_dataframe(df, question)
+                answer, generated_code, _ = query_dataframe(df, question)
                 
                 return {
                     "answer": answer,
@@ -280,21 +308,15 @@ class EnhancedQueryEngine:
     
     def optimize_query_strategy(self, question: str, session_context: Dict[str, Any]) -> str:
         """Otimiza a estratégia de consulta baseada no histórico e contexto"""
-        # Análise simples para determinar melhor estratégia
-        question_lower = question.lower()
+        # Análise simples para determinar melhor estratégia (casamentos compartilhados com os agentes)
+        matches = match_question(question)
         
         # Consultas complexas se beneficiam do sistema multi-agente
-        complexity_indicators = [
-            "comparar", "correlação", "tendência", "análise", "insights",
-            "padrões", "distribuição", "múltiplas", "várias"
-        ]
-        
-        if any(indicator in question_lower for indicator in complexity_indicators):
+        if matches.has("strategy:complex"):
             return "multi_agent"
         
         # Consultas simples podem usar método tradicional
-        simple_indicators = ["média", "total", "count", "máximo", "mínimo"]
-        if any(indicator in question_lower for indicator in simple_indicators):
+        if matches.has("strategy:simple"):
             return "traditional"
         
         # Default para multi-agente para melhor experiência
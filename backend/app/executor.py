@@ -0,0 +1,341 @@
+# backend/app/executor.py
+
+import os
+import asyncio
+import logging
+import threading
+import contextvars
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from multiprocessing import shared_memory
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import pandas as pd
+import pyarrow as pa
+from fastapi import HTTPException
+
+from app.query_control import current_query
+
+# Configurar logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+QUERY_EXECUTOR_WORKERS = int(os.getenv("QUERY_EXECUTOR_WORKERS", 8))
+# Consultas simultâneas (em execução + na fila) antes de responder 429
+QUERY_MAX_IN_FLIGHT = int(os.getenv("QUERY_MAX_IN_FLIGHT", QUERY_EXECUTOR_WORKERS * 4))
+QUERY_RETRY_AFTER_SECONDS = int(os.getenv("QUERY_RETRY_AFTER_SECONDS", 5))
+# 0 desativa o pool de processos; tudo roda no pool de threads
+PANDAS_PROCESS_WORKERS = int(os.getenv("PANDAS_PROCESS_WORKERS", 0))
+PANDAS_PROCESS_MIN_BYTES = int(os.getenv("PANDAS_PROCESS_MIN_MB", 64)) * 1024 * 1024
+# Fan-out de /query/batch: perguntas de um lote consultadas em paralelo
+BATCH_QUERY_CONCURRENCY = int(os.getenv("BATCH_QUERY_CONCURRENCY", 4))
+BATCH_MAX_QUESTIONS = int(os.getenv("BATCH_MAX_QUESTIONS", 100))
+
+# Pool limitado para trabalho bloqueante (Pandas, SQL, E/S de disco) fora do event loop
+query_executor = ThreadPoolExecutor(
+    max_workers=QUERY_EXECUTOR_WORKERS,
+    thread_name_prefix="query"
+)
+
+class TaskCounter:
+    """Tarefas enviadas ao pool de threads: na fila e em execução."""
+
+    def __init__(self):
+        self.queued = 0
+        self.running = 0
+        self._lock = threading.Lock()
+
+    def submitted(self):
+        with self._lock:
+            self.queued += 1
+
+    def run(self, func: Callable[..., Any], *args, **kwargs) -> Any:
+        with self._lock:
+            self.queued -= 1
+            self.running += 1
+        try:
+            return func(*args, **kwargs)
+        finally:
+            with self._lock:
+                self.running -= 1
+
+    def forget_cancelled(self, future):
+        """Done callback: tarefa cancelada antes de começar sai da fila."""
+        if future.cancelled():
+            with self._lock:
+                self.queued -= 1
+
+# Ocupação do pool de consultas, contada por run_blocking
+query_tasks = TaskCounter()
+
+_process_pool: Optional["KillableProcessPool"] = None
+_process_pool_lock = threading.Lock()
+
+class AdmissionController:
+    """
+    Controle de admissão: limita as consultas simultâneas e recusa o excedente
+    com 429 em vez de deixá-lo esperar numa fila sem fim.
+    """
+
+    def __init__(self, max_in_flight: int, retry_after_seconds: int):
+        self.max_in_flight = max_in_flight
+        self.retry_after_seconds = retry_after_seconds
+        self.in_flight = 0
+        self.admitted = 0
+        self.rejected = 0
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Reserva uma vaga ou levanta HTTPException 429."""
+        with self._lock:
+            if self.max_in_flight > 0 and self.in_flight >= self.max_in_flight:
+                self.rejected += 1
+                raise HTTPException(
+                    status_code=429,
+                    detail="Servidor ocupado: muitas consultas em andamento. Tente novamente em instantes.",
+                    headers={"Retry-After": str(self.retry_after_seconds)}
+                )
+            self.in_flight += 1
+            self.admitted += 1
+
+    def release(self):
+        with self._lock:
+            self.in_flight -= 1
+
+    @contextmanager
+    def admit(self):
+        self.acquire()
+        try:
+            yield
+        finally:
+            self.release()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "in_flight": self.in_flight,
+            "max_in_flight": self.max_in_flight,
+            "admitted": self.admitted,
+            "rejected": self.rejected
+        }
+
+# Instância global do controle de admissão de consultas
+query_admission = AdmissionController(QUERY_MAX_IN_FLIGHT, QUERY_RETRY_AFTER_SECONDS)
+
+async def admit_query():
+    """Dependency que reserva uma vaga de consulta durante a requisição (ou responde 429)"""
+    with query_admission.admit():
+        yield
+
+async def run_blocking(func: Callable[..., Any], *args, **kwargs) -> Any:
+    """
+    Executa uma função bloqueante no pool de consultas sem travar o event loop.
+    O contexto (ex.: a consulta atual de app.query_control) segue para a thread.
+    """
+    loop = asyncio.get_running_loop()
+    context = contextvars.copy_context()
+    query_tasks.submitted()
+    future = query_executor.submit(query_tasks.run, context.run, func, *args, **kwargs)
+    future.add_done_callback(query_tasks.forget_cancelled)
+    return await asyncio.wrap_future(future, loop=loop)
+
+class ProcessKilled(RuntimeError):
+    """A tarefa foi interrompida: o processo que a executava foi encerrado."""
+
+def _process_worker_loop(conn):
+    """Laço do processo filho: executa tarefas (função, argumentos) recebidas pelo pipe."""
+    while True:
+        try:
+            message = conn.recv()
+        except EOFError:
+            break
+        if message is None:
+            break
+        func, args = message
+        try:
+            conn.send((True, func(*args)))
+        except Exception as e:
+            conn.send((False, f"{type(e).__name__}: {e}"))
+
+class KillableProcessPool:
+    """
+    Pool de processos (spawn) em que cada tarefa pode ser interrompida: ao
+    estourar o prazo ou ser cancelada, o processo que a executa é encerrado
+    e a vaga é liberada para que um processo novo o substitua, sem afetar as
+    demais tarefas.
+    """
+
+    def __init__(self, max_workers: int, poll_interval: float = 0.1):
+        self.max_workers = max_workers
+        self.poll_interval = poll_interval
+        self._context = multiprocessing.get_context("spawn")
+        self._idle: List[Tuple[Any, Any]] = []
+        self._started = 0
+        self._condition = threading.Condition()
+        self.killed = 0
+
+    def _start_worker(self):
+        parent_conn, child_conn = self._context.Pipe()
+        process = self._context.Process(target=_process_worker_loop, args=(child_conn,), daemon=True)
+        process.start()
+        child_conn.close()
+        return process, parent_conn
+
+    def _checkout(self, control):
+        """Reserva um processo ocioso ou inicia um novo; espera enquanto todos estão ocupados."""
+        with self._condition:
+            while not self._idle and self._started >= self.max_workers:
+                # Consulta interrompida enquanto esperava: não segura a thread nem a memória compartilhada
+                if control is not None and control.should_stop():
+                    raise ProcessKilled(f"Consulta {control.query_id} interrompida enquanto aguardava um processo")
+                self._condition.wait(self.poll_interval)
+            if self._idle:
+                return self._idle.pop()
+            self._started += 1
+        try:
+            return self._start_worker()
+        except Exception:
+            with self._condition:
+                self._started -= 1
+                self._condition.notify()
+            raise
+
+    def _checkin(self, worker):
+        with self._condition:
+            self._idle.append(worker)
+            self._condition.notify()
+
+    def _discard(self, worker):
+        process, conn = worker
+        if process.is_alive():
+            process.kill()
+        process.join()
+        conn.close()
+        # Libera a vaga: quem estiver esperando em _checkout inicia o substituto
+        with self._condition:
+            self._started -= 1
+            self._condition.notify()
+
+    def run(self, func: Callable[..., Any], *args) -> Any:
+        """Executa func(*args) num processo; bloqueia até o resultado, prazo ou cancelamento."""
+        control = current_query.get()
+        worker = self._checkout(control)
+        process, conn = worker
+        try:
+            conn.send((func, args))
+            while not conn.poll(self.poll_interval):
+                if control is not None and control.should_stop():
+                    self.killed += 1
+                    self._discard(worker)
+                    worker = None
+                    raise ProcessKilled(f"Processo encerrado: consulta {control.query_id} interrompida")
+                if not process.is_alive():
+                    self._discard(worker)
+                    worker = None
+                    raise ProcessKilled("O processo de execução terminou inesperadamente")
+            ok, payload = conn.recv()
+        except (EOFError, OSError):
+            if worker is not None:
+                self._discard(worker)
+                worker = None
+            raise ProcessKilled("O processo de execução terminou inesperadamente")
+        finally:
+            if worker is not None:
+                self._checkin(worker)
+        if not ok:
+            raise RuntimeError(payload)
+        return payload
+
+    def stats(self) -> Dict[str, Any]:
+        with self._condition:
+            return {"workers": self._started, "idle": len(self._idle), "killed": self.killed}
+
+def _get_process_pool() -> Optional[KillableProcessPool]:
+    global _process_pool
+    if PANDAS_PROCESS_WORKERS <= 0:
+        return None
+    if _process_pool is None:
+        with _process_pool_lock:
+            if _process_pool is None:
+                # spawn: o processo pai tem threads (event loop, pools), fork não é seguro
+                _process_pool = KillableProcessPool(PANDAS_PROCESS_WORKERS)
+    return _process_pool
+
+def _dataframe_to_shared_memory(df: pd.DataFrame) -> Tuple[shared_memory.SharedMemory, int]:
+    """Serializa o DataFrame em formato Arrow IPC direto num bloco de memória compartilhada."""
+    table = pa.Table.from_pandas(df, preserve_index=True)
+    # Primeira passada só mede o tamanho do stream, sem copiar os dados
+    mock = pa.MockOutputStream()
+    with pa.ipc.new_stream(mock, table.schema) as writer:
+        writer.write_table(table)
+    size = mock.size()
+    shm = shared_memory.SharedMemory(create=True, size=max(size, 1))
+    try:
+        sink = pa.FixedSizeBufferWriter(pa.py_buffer(shm.buf))
+        with pa.ipc.new_stream(sink, table.schema) as writer:
+            writer.write_table(table)
+        del sink
+    except Exception:
+        shm.close()
+        shm.unlink()
+        raise
+    return shm, size
+
+def _run_instruction_in_process(shm_name: str, size: int, instruction: str) -> str:
+    """Executado no processo filho: lê o DataFrame da memória compartilhada e roda a instrução."""
+    from app.query_engine import run_pandas_instruction
+
+    shm = shared_memory.SharedMemory(name=shm_name)
+    try:
+        table = pa.ipc.open_stream(pa.py_buffer(shm.buf[:size])).read_all()
+        df = table.to_pandas()
+        del table
+        output = run_pandas_instruction(df, instruction)
+        del df
+        return output
+    finally:
+        try:
+            shm.close()
+        except BufferError:
+            # Ainda há views Arrow abertas; o bloco é liberado quando o processo as descarta
+            pass
+
+async def run_pandas(df: pd.DataFrame, instruction: str) -> str:
+    """
+    Executa uma instrução Pandas gerada fora do event loop.
+
+    DataFrames a partir de PANDAS_PROCESS_MIN_MB vão para o pool de processos
+    (sem disputar o GIL com o servidor), recebendo os dados via Arrow em
+    memória compartilhada; os demais rodam no pool de threads. Só no pool de
+    processos a execução pode ser interrompida por prazo ou cancelamento.
+    """
+    from app.query_engine import run_pandas_instruction
+
+    pool = _get_process_pool()
+    if pool is None or df.memory_usage(deep=False).sum() < PANDAS_PROCESS_MIN_BYTES:
+        return await run_blocking(run_pandas_instruction, df, instruction)
+
+    try:
+        shm, size = await run_blocking(_dataframe_to_shared_memory, df)
+    except (pa.ArrowException, ValueError, TypeError) as e:
+        logger.warning(f"DataFrame não convertido para Arrow, executando em thread: {e}")
+        return await run_blocking(run_pandas_instruction, df, instruction)
+
+    try:
+        # A thread do executor acompanha o processo e o encerra se a consulta expirar
+        return await run_blocking(pool.run, _run_instruction_in_process, shm.name, size, instruction)
+    finally:
+        shm.close()
+        shm.unlink()
+
+def executor_stats() -> Dict[str, Any]:
+    """Limites e ocupação dos pools de execução."""
+    return {
+        "thread_workers": QUERY_EXECUTOR_WORKERS,
+        "thread_queue": query_tasks.queued,
+        "thread_running": query_tasks.running,
+        "process_workers": PANDAS_PROCESS_WORKERS,
+        "process_min_bytes": PANDAS_PROCESS_MIN_BYTES,
+        "process_pool": _process_pool.stats() if _process_pool is not None else None,
+        "admission": query_admission.stats()
+    }
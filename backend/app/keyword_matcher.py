@@ -0,0 +1,153 @@
+# backend/app/keyword_matcher.py
+
+import re
+import logging
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Dict, FrozenSet, Iterable, List
+
+# Configurar logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Vocabulário das perguntas usado pelos agentes e pelo motor aprimorado.
+# O casamento é por palavra inteira, então plurais e flexões são listados
+# explicitamente (a antiga busca por substring os aceitava por acaso, junto
+# com falsos positivos como "com" em "comparar").
+INTENT_KEYWORDS: Dict[str, List[str]] = {
+    "aggregation": [
+        "média", "médias", "total", "totais", "soma", "somas", "count",
+        "máximo", "máximos", "máxima", "máximas", "mínimo", "mínimos", "mínima", "mínimas",
+        "average", "averages", "sum", "sums", "max", "min"
+    ],
+    "filtering": [
+        "onde", "filter", "filtered", "com", "que", "when", "where",
+        "igual", "iguais", "maior", "maiores", "menor", "menores", "entre"
+    ],
+    "comparison": [
+        "comparar", "compara", "comparação", "comparações", "diferença", "diferenças",
+        "versus", "vs", "compare", "difference", "differences", "em relação"
+    ],
+    "trend": [
+        "tendência", "tendências", "evolução", "evoluções", "ao longo", "trend", "trends",
+        "over time", "temporal", "período", "períodos"
+    ],
+    "distribution": [
+        "distribuição", "distribuições", "frequência", "frequências", "histogram", "histograms",
+        "distribution", "distributions", "frequency", "frequencies", "percentual", "percentuais"
+    ],
+    "correlation": [
+        "correlação", "correlações", "relação", "relações", "correlation", "correlations",
+        "relationship", "relationships", "dependência", "dependências", "influência", "influências"
+    ]
+}
+
+COMPLEXITY_KEYWORDS: List[str] = [
+    "múltiplas", "múltiplos", "várias", "vários", "complex", "advanced",
+    "relacionar", "relacionando", "combinar", "combinando", "agrupar", "agrupando", "agrupado", "agrupados",
+    "categorizar", "categorizando", "analisar", "analisando"
+]
+
+CONTEXT_KEYWORDS: Dict[str, List[str]] = {
+    "temporal": ["quando", "data", "datas", "período", "períodos", "mês", "meses", "ano", "anos"],
+    "comparative": ["mais", "menos", "maior", "maiores", "menor", "menores", "igual", "iguais"],
+    "categorical": ["tipo", "tipos", "categoria", "categorias", "classe", "classes", "grupo", "grupos"],
+    "numeric": ["quantidade", "quantidades", "valor", "valores", "número", "números", "total", "totais"]
+}
+
+STRATEGY_KEYWORDS: Dict[str, List[str]] = {
+    # Consultas complexas se beneficiam do sistema multi-agente
+    "complex": [
+        "comparar", "correlação", "correlações", "tendência", "tendências", "análise", "análises",
+        "insight", "insights", "padrão", "padrões", "distribuição", "distribuições",
+        "múltiplas", "múltiplos", "várias", "vários"
+    ],
+    "simple": [
+        "média", "médias", "total", "totais", "count",
+        "máximo", "máximos", "máxima", "mínimo", "mínimos", "mínima"
+    ]
+}
+
+# Operação pedida, usada para escolher o código/SQL e o texto da resposta
+OPERATION_KEYWORDS: Dict[str, List[str]] = {
+    "average": ["média", "médias", "average", "averages"],
+    "total": ["total", "totais", "soma", "somas", "sum", "sums"],
+    "count": ["count", "quantidade", "quantidades"]
+}
+
+@dataclass(frozen=True)
+class QuestionMatches:
+    """Palavras-chave encontradas numa pergunta, agrupadas por grupo do vocabulário."""
+    keywords: FrozenSet[str]
+    groups: Dict[str, FrozenSet[str]]
+    word_count: int
+
+    def matched(self, group: str) -> FrozenSet[str]:
+        return self.groups.get(group, frozenset())
+
+    def has(self, group: str) -> bool:
+        return group in self.groups
+
+class KeywordMatcher:
+    """
+    Casamento de várias listas de palavras-chave numa única passada.
+
+    Todas as palavras-chave formam uma só expressão regular (alternação com
+    limites de palavra, mais longas primeiro); cada ocorrência é mapeada para
+    os grupos a que pertence. Limites de palavra evitam falsos positivos como
+    "com" dentro de "comparar"; em troca, flexões (plurais etc.) só casam se
+    estiverem nas listas.
+    """
+
+    def __init__(self, groups: Dict[str, Iterable[str]]):
+        self._groups_by_keyword: Dict[str, FrozenSet[str]] = {}
+        for group, keywords in groups.items():
+            for keyword in keywords:
+                keyword = keyword.lower()
+                self._groups_by_keyword[keyword] = self._groups_by_keyword.get(keyword, frozenset()) | {group}
+        keywords = sorted(self._groups_by_keyword, key=len, reverse=True)
+        # Lookahead: casamentos sobrepostos em posições diferentes ("em relação" e "relação")
+        self._pattern = re.compile(
+            r"(?=(?<!\w)(" + "|".join(re.escape(k) for k in keywords) + r")(?!\w))"
+        )
+        # Expressões que começam por outra palavra-chave, casadas na mesma posição
+        self._prefixes: Dict[str, FrozenSet[str]] = {
+            keyword: frozenset(k for k in keywords if k != keyword and keyword.startswith(k + " "))
+            for keyword in keywords
+        }
+
+    def match(self, text: str) -> QuestionMatches:
+        text = text.lower()
+        found = set()
+        for match in self._pattern.finditer(text):
+            keyword = match.group(1)
+            found.add(keyword)
+            found.update(self._prefixes[keyword])
+        groups: Dict[str, set] = {}
+        for keyword in found:
+            for group in self._groups_by_keyword[keyword]:
+                groups.setdefault(group, set()).add(keyword)
+        return QuestionMatches(
+            keywords=frozenset(found),
+            groups={group: frozenset(keywords) for group, keywords in groups.items()},
+            word_count=len(text.split())
+        )
+
+def _question_groups() -> Dict[str, List[str]]:
+    groups = {f"intent:{intent}": keywords for intent, keywords in INTENT_KEYWORDS.items()}
+    groups["complexity"] = COMPLEXITY_KEYWORDS
+    groups.update({f"context:{name}": keywords for name, keywords in CONTEXT_KEYWORDS.items()})
+    groups.update({f"strategy:{name}": keywords for name, keywords in STRATEGY_KEYWORDS.items()})
+    groups.update({f"operation:{name}": keywords for name, keywords in OPERATION_KEYWORDS.items()})
+    return groups
+
+# Instância global com todo o vocabulário das perguntas
+question_matcher = KeywordMatcher(_question_groups())
+
+@lru_cache(maxsize=1024)
+def match_question(question: str) -> QuestionMatches:
+    """
+    Casamentos da pergunta, calculados uma vez e reaproveitados por todos os
+    agentes que a analisam.
+    """
+    return question_matcher.match(question)
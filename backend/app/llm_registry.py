@@ -0,0 +1,106 @@
+# backend/app/llm_registry.py
+
+import os
+import json
+import threading
+import logging
+from typing import Dict, Any, Optional, Tuple
+
+import httpx
+from llama_index.llms.openai import OpenAI
+
+# Configurar logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+DEFAULT_LLM_MODEL = "gpt-3.5-turbo"
+
+class LLMRegistry:
+    """
+    Registro de clientes LLM do processo.
+
+    Os clientes são criados sob demanda, uma vez por combinação de modelo e
+    parâmetros, e compartilham os mesmos pools de conexões HTTP (keep-alive,
+    síncrono e assíncrono), evitando reconstrução e novos handshakes TLS a
+    cada consulta.
+    """
+
+    def __init__(self):
+        self.max_connections = int(os.getenv("LLM_MAX_CONNECTIONS", 20))
+        self.max_keepalive_connections = int(os.getenv("LLM_MAX_KEEPALIVE_CONNECTIONS", 10))
+        self.timeout_seconds = float(os.getenv("LLM_TIMEOUT_SECONDS", 60))
+        self._clients: Dict[Tuple[str, str], OpenAI] = {}
+        self._http_client: Optional[httpx.Client] = None
+        self._async_http_client: Optional[httpx.AsyncClient] = None
+        self._lock = threading.Lock()
+
+    def _get_http_client(self) -> httpx.Client:
+        if self._http_client is None:
+            self._http_client = httpx.Client(
+                limits=httpx.Limits(
+                    max_connections=self.max_connections,
+                    max_keepalive_connections=self.max_keepalive_connections
+                ),
+                timeout=self.timeout_seconds
+            )
+        return self._http_client
+
+    def _get_async_http_client(self) -> httpx.AsyncClient:
+        # Usado pelas chamadas assíncronas (apredict/aquery) no event loop do worker
+        if self._async_http_client is None:
+            self._async_http_client = httpx.AsyncClient(
+                limits=httpx.Limits(
+                    max_connections=self.max_connections,
+                    max_keepalive_connections=self.max_keepalive_connections
+                ),
+                timeout=self.timeout_seconds
+            )
+        return self._async_http_client
+
+    def get(self, model: str = DEFAULT_LLM_MODEL, **params) -> OpenAI:
+        """Retorna o cliente para o modelo/parâmetros, criando-o na primeira chamada."""
+        api_key = os.getenv("OPENAI_API_KEY")
+        if not api_key:
+            raise ValueError("Chave da API OpenAI não encontrada.")
+        key = (model, json.dumps(params, sort_keys=True, default=str))
+        client = self._clients.get(key)
+        if client is not None:
+            return client
+        with self._lock:
+            client = self._clients.get(key)
+            if client is None:
+                logger.info(f"Criando cliente LLM para o modelo {model}")
+                client = OpenAI(
+                    model=model,
+                    api_key=api_key,
+                    http_client=self._get_http_client(),
+                    async_http_client=self._get_async_http_client(),
+                    **params
+                )
+                self._clients[key] = client
+            return client
+
+    def stats(self) -> Dict[str, Any]:
+        """Clientes criados e limites do pool HTTP."""
+        return {
+            "clients": [{"model": model, "params": json.loads(params)} for model, params in self._clients],
+            "max_connections": self.max_connections,
+            "max_keepalive_connections": self.max_keepalive_connections
+        }
+
+    def clear(self):
+        """Descarta os clientes (ex.: após troca da chave da API)."""
+        with self._lock:
+            self._clients.clear()
+            if self._http_client is not None:
+                self._http_client.close()
+                self._http_client = None
+            # O cliente assíncrono é apenas descartado: fechá-lo exige o event loop
+            self._async_http_client = None
+
+# Instância global do registro de LLMs
+llm_registry = LLMRegistry()
+
+def get_llm(model: str = DEFAULT_LLM_MODEL, **params) -> OpenAI:
+    """Atalho para obter um cliente LLM compartilhado"""
+    return llm_registry.get(model, **params)
@@ -1,20 +1,33 @@
 # backend/main.py
 
 import os
+import json
+import time
 import uuid
+import asyncio
 from fastapi import FastAPI, UploadFile, File, HTTPException, Depends, Body
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import StreamingResponse
+from fastapi.responses import StreamingResponse, Response
 from pydantic import BaseModel, Field
 from dotenv import load_dotenv
 import pandas as pd
 import io
 import numpy as np
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, Callable
 
 from app.data_loader import load_dataframe_from_file
-from app.query_engine import query_dataframe
-from app.db_connector import get_sqlite_engine, get_db_tables_and_preview, create_sql_query_engine, query_database_engine
+from app.query_engine import aquery_dataframe, astream_dataframe_query, build_data_context, create_pandas_query_engine, aexecute_cached_pandas_code
+from app.db_connector import get_sqlite_engine, get_db_tables_and_columns, get_cached_table_preview, create_sql_query_engine, query_database_engine, execute_cached_sql, sql_query_engine_cache
+from app.session_store import create_session_store
+from app.security import verify_api_key
+from app.database_security import secure_db_connector, STREAM_MEDIA_TYPES
+from app.llm_registry import llm_registry
+from app.engine_registry import engine_registry
+from app.schema_catalog import schema_catalog
+from app.answer_cache import answer_cache, code_cache, session_fingerprint, schema_signature, normalize_question
+from app.executor import run_blocking, admit_query, query_admission, executor_stats, BATCH_QUERY_CONCURRENCY, BATCH_MAX_QUESTIONS
+from app.query_control import query_registry, run_with_control, stream_with_control, current_query
+from app.sql_validator import sql_validator
 # from app.pdf_generator import generate_report_pdf # Importar quando for criado
 
 # Carregar variáveis de ambiente
@@ -43,86 +56,121 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# --- Gerenciamento de Estado Simples (In-Memory) ---
-# ATENÇÃO: Esta abordagem em memória não é adequada para produção.
-# Sessões serão perdidas se o servidor reiniciar.
-# Considere Redis, um banco de dados, ou outra solução persistente.
+# --- Gerenciamento de Estado ---
+# Por padrão as sessões ficam na memória deste processo (sessões frias vão para disco).
+# Para rodar com vários workers (uvicorn --workers N), use SESSION_BACKEND=sqlite,
+# que compartilha metadados, histórico e DataFrames entre os processos.
 data_sessions = {}
 
 class SessionManager:
     def __init__(self):
-        self.sessions = {}
+        # Store com orçamento de memória (LRU) e TTL por sessão.
+        # Com SESSION_BACKEND=sqlite as sessões são compartilhadas entre workers.
+        self.sessions = create_session_store(engine_factory=get_sqlite_engine)
 
-    def create_dataframe_session(self, df: pd.DataFrame, filename: str):
+    def create_dataframe_session(self, df: pd.DataFrame, filename: str, ttl_seconds: Optional[int] = None):
         session_id = str(uuid.uuid4())
-        self.sessions[session_id] = {
+        self.sessions.put(session_id, {
             "type": "dataframe",
             "dataframe": df,
             "filename": filename,
             "history": [],
             "query_engine": None # Query engine será criado sob demanda
-        }
+        }, ttl_seconds=ttl_seconds)
         print(f"Sessão DataFrame {session_id} criada para {filename}")
         return session_id
 
-    def create_db_session(self, engine, db_path: str, tables: list[str]):
+    def create_db_session(self, engine, db_path: str, tables: list[str], ttl_seconds: Optional[int] = None):
         session_id = str(uuid.uuid4())
         # Não armazenamos a engine diretamente por segurança/serialização
         # Armazenamos o necessário para recriar a engine ou o query_engine
-        self.sessions[session_id] = {
+        self.sessions.put(session_id, {
             "type": "database",
             "db_path": db_path, # Ou connection string
             "tables": tables,
             "engine_instance": engine, # Guardar a instância para reutilização na sessão
             "query_engine": None, # Será criado sob demanda
             "history": []
-        }
+        }, ttl_seconds=ttl_seconds)
         print(f"Sessão DB {session_id} criada para {db_path} (tabelas: {tables})")
         return session_id
 
     def get_session_data(self, session_id: str):
-        if session_id not in self.sessions:
+        session_data = self.sessions.get(session_id)
+        if session_data is None:
             print(f"Tentativa de acesso à sessão inexistente: {session_id}")
             raise HTTPException(status_code=404, detail="Sessão não encontrada ou expirada.")
-        return self.sessions[session_id]
+        return session_data
 
     def get_query_engine(self, session_id: str):
         session_data = self.get_session_data(session_id)
         
-        if session_data.get("query_engine") is None:
-            print(f"Criando query engine para sessão {session_id}...")
-            if session_data["type"] == "dataframe":
-                # Cria engine para DataFrame sob demanda
-                # Note: PandasQueryEngine não precisa ser armazenado, pode ser criado a cada query
-                # Mas para consistência, vamos seguir o padrão
-                pass # Não há engine persistente para PandasQueryEngine
-            elif session_data["type"] == "database":
-                # Cria engine SQL sob demanda
-                session_data["query_engine"] = create_sql_query_engine(
-                    session_data["engine_instance"],
-                    session_data["tables"]
-                )
-            else:
-                 raise HTTPException(status_code=500, detail="Tipo de sessão desconhecido.")
+        if session_data["type"] == "dataframe":
+            df = session_data["dataframe"]
+            # Engine e perfil dos dados são reconstruídos apenas se o DataFrame mudou
+            if session_data.get("query_engine") is None or session_data.get("engine_dataframe") is not df:
+                print(f"Criando query engine para sessão {session_id}...")
+                session_data["data_context"] = build_data_context(df)
+                session_data["query_engine"] = create_pandas_query_engine(df, session_data["data_context"])
+                session_data["engine_dataframe"] = df
+        elif session_data["type"] == "database":
+            # Compartilhado entre sessões do mesmo banco/tabelas; o cache confere
+            # a versão do schema a cada pedido
+            session_data["query_engine"] = create_sql_query_engine(
+                session_data["engine_instance"],
+                session_data["tables"]
+            )
+        else:
+            raise HTTPException(status_code=500, detail="Tipo de sessão desconhecido.")
         
-        return session_data.get("query_engine") # Retorna None para dataframe
+        return session_data.get("query_engine")
 
     def add_history(self, session_id: str, question: str, answer: str, code: str):
-        session_data = self.get_session_data(session_id)
-        session_data["history"].append({
+        added = self.sessions.append_history(session_id, {
             "id": str(uuid.uuid4()),
             "question": question,
             "answer": answer,
             "code": code
         })
+        if not added:
+            raise HTTPException(status_code=404, detail="Sessão não encontrada ou expirada.")
         print(f"Histórico adicionado à sessão {session_id}: Q: {question[:50]}...")
 
 session_manager = SessionManager()
 
+# Limites de /table_previews
+MAX_PREVIEW_ROWS = int(os.getenv("MAX_ROWS_PREVIEW", 100))
+MAX_PREVIEW_PAGE_SIZE = 50
+PREVIEW_CONCURRENCY = int(os.getenv("PREVIEW_CONCURRENCY", 4))
+
 # --- Modelos Pydantic ---
 class QueryRequest(BaseModel):
     session_id: str
     question: str
+    query_id: Optional[str] = Field(None, description="Identificador para cancelar a consulta em POST /query/{query_id}/cancel (gerado se omitido).")
+    timeout_seconds: Optional[float] = Field(None, gt=0, description="Prazo da consulta (padrão QUERY_TIMEOUT_SECONDS, limitado por QUERY_MAX_TIMEOUT_SECONDS).")
+
+class BatchQueryRequest(BaseModel):
+    session_id: str
+    questions: list[str]
+    max_concurrency: Optional[int] = Field(None, description="Consultas simultâneas ao LLM (limitado por BATCH_QUERY_CONCURRENCY).")
+    query_id: Optional[str] = Field(None, description="Identificador para cancelar o lote inteiro.")
+    timeout_seconds: Optional[float] = Field(None, gt=0, description="Prazo de cada pergunta do lote.")
+
+class SQLRequest(BaseModel):
+    session_id: str
+    sql: str = Field(..., description="Consulta SELECT a executar no banco da sessão.")
+    format: str = Field("columns", description="Formato do resultado: columns (JSON por coluna), records (lista de linhas) ou arrow (Arrow IPC).")
+    query_id: Optional[str] = Field(None, description="Identificador para cancelar a consulta em POST /query/{query_id}/cancel (gerado se omitido).")
+    timeout_seconds: Optional[float] = Field(None, gt=0, description="Prazo da consulta (padrão QUERY_TIMEOUT_SECONDS, limitado por QUERY_MAX_TIMEOUT_SECONDS).")
+
+class SQLStreamRequest(BaseModel):
+    session_id: str
+    sql: str = Field(..., description="Consulta SELECT a executar no banco da sessão (sem LIMIT implícito).")
+    format: str = Field("ndjson", description="Formato do stream: ndjson, csv ou arrow.")
+    max_rows: Optional[int] = Field(None, gt=0, description="Máximo de linhas (limitado por SQL_STREAM_MAX_ROWS).")
+    query_id: Optional[str] = Field(None, description="Identificador para cancelar o stream em POST /query/{query_id}/cancel.")
+    timeout_seconds: Optional[float] = Field(None, gt=0, description="Prazo de todo o stream (padrão QUERY_TIMEOUT_SECONDS, limitado por QUERY_MAX_TIMEOUT_SECONDS).")
 
 class PdfRequest(BaseModel):
     session_id: str
@@ -130,6 +178,7 @@ class PdfRequest(BaseModel):
 
 class DBConnectionRequest(BaseModel):
     db_path: str = Field(..., description="Caminho para o arquivo do banco de dados SQLite.")
+    ttl_seconds: Optional[int] = Field(None, description="Tempo de inatividade (s) até a sessão expirar (0 = sem expiração). Usa o padrão do servidor se omitido.")
     # Adicionar campos para outros tipos de BD (host, port, user, password, db_name) depois
 
 # Atualizar o modelo de resposta para incluir SQL
@@ -137,17 +186,43 @@ class QueryResponse(BaseModel):
     answer: str
     generated_code: Optional[str] = None
     sql_equivalent: Optional[str] = None
+    cached: bool = False
+
+class StreamingResponseWithCleanup(StreamingResponse):
+    """
+    StreamingResponse que sempre executa on_close ao terminar, inclusive quando
+    o cliente desconecta antes do primeiro pedaço e o gerador nem chega a
+    iniciar (e, portanto, o seu finally não roda).
+    """
+
+    def __init__(self, content, on_close: Callable[[], None], **kwargs):
+        super().__init__(content, **kwargs)
+        self.on_close = on_close
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            try:
+                aclose = getattr(self.body_iterator, "aclose", None)
+                if aclose is not None:
+                    await aclose()
+            finally:
+                self.on_close()
 
 # --- Endpoints ---
 
-@app.post("/upload", summary="Upload de arquivo de dados (CSV, Excel, JSON, Parquet)")
-async def upload_data_file(file: UploadFile = File(...) ):
+@app.post("/upload", summary="Upload de arquivo de dados (CSV, Excel, JSON, Parquet, Arrow)")
+async def upload_data_file(file: UploadFile = File(...), compact: bool = False, columns: Optional[str] = None,
+                           ttl_seconds: Optional[int] = None):
     if not file.filename:
         raise HTTPException(status_code=400, detail="Nome do arquivo não fornecido.")
     print(f"Recebendo upload do arquivo: {file.filename}")
     try:
-        df = await load_dataframe_from_file(file)
-        session_id = session_manager.create_dataframe_session(df, file.filename)
+        # Projeção de colunas (lista separada por vírgulas) para Parquet/Arrow
+        selected_columns = [c.strip() for c in columns.split(",") if c.strip()] if columns else None
+        df, load_info = await load_dataframe_from_file(file, compact=compact, columns=selected_columns)
+        session_id = session_manager.create_dataframe_session(df, file.filename, ttl_seconds=ttl_seconds)
         
         # Obter preview e tratar valores não finitos explicitamente
         preview_data_raw = df.head().to_dict(orient='records')
@@ -171,8 +246,12 @@ async def upload_data_file(file: UploadFile = File(...) ):
             "filename": file.filename,
             "columns": columns,
             "preview": preview_data_cleaned, # Usar dados limpos
-            "data_type": "dataframe"
+            "data_type": "dataframe",
+            "dialect": load_info.get("dialect"), # Apenas para CSV
+            "memory": load_info.get("memory") # Apenas no modo compacto
         }
+    except HTTPException as http_exc:
+        raise http_exc
     except ValueError as e:
         print(f"Erro de valor durante o upload: {e}")
         raise HTTPException(status_code=400, detail=str(e))
@@ -189,20 +268,21 @@ async def connect_database(request: DBConnectionRequest):
          raise HTTPException(status_code=400, detail=f"Arquivo do banco de dados não encontrado em: {request.db_path}")
     try:
         engine = get_sqlite_engine(request.db_path)
-        table_names, previews = get_db_tables_and_preview(engine)
+        table_names, columns = await run_blocking(get_db_tables_and_columns, engine)
         
         if not table_names:
             raise HTTPException(status_code=400, detail="Nenhuma tabela encontrada no banco de dados.")
             
         # Iniciar sessão com todas as tabelas por padrão
-        session_id = session_manager.create_db_session(engine, request.db_path, table_names)
+        session_id = session_manager.create_db_session(engine, request.db_path, table_names, ttl_seconds=request.ttl_seconds)
         print(f"Conexão com BD {request.db_path} estabelecida. Session ID: {session_id}")
         return {
             "message": "Conexão com banco de dados estabelecida com sucesso!",
             "session_id": session_id,
             "db_path": request.db_path,
             "tables": table_names,
-            "previews": previews, # Dicionário com preview de cada tabela
+            "columns": columns, # Colunas (nome e tipo) de cada tabela
+            "previews": {}, # Carregados sob demanda via /table_previews
             "data_type": "database"
         }
     except HTTPException as http_exc:
@@ -211,35 +291,223 @@ async def connect_database(request: DBConnectionRequest):
         print(f"Erro inesperado ao conectar ao BD: {e}")
         raise HTTPException(status_code=500, detail=f"Erro interno ao conectar ao banco de dados: {e}")
 
-@app.post("/query", summary="Executa uma pergunta sobre os dados carregados")
-async def execute_query(request: QueryRequest):
-    print(f"Recebida query para sessão {request.session_id}: {request.question[:50]}...")
+async def _lookup_cached_answer(request: QueryRequest, session_data: Dict[str, Any]):
+    """Mesma pergunta sobre os mesmos dados: retorna (fingerprint, resposta em cache ou None)."""
+    fingerprint = await run_blocking(session_fingerprint, session_data)
+    cached = await run_blocking(answer_cache.get, request.question, fingerprint)
+    if cached is not None:
+        await run_blocking(session_manager.add_history, request.session_id, request.question,
+                           cached["answer"], cached.get("generated_code"))
+        print(f"Consulta para sessão {request.session_id} respondida pelo cache.")
+    return fingerprint, cached
+
+async def _reuse_cached_code(request: QueryRequest, session_data: Dict[str, Any], signature: Optional[str]):
+    """
+    Mesmo schema: reexecuta localmente o código gerado antes, sem chamar o LLM.
+    Retorna (answer, generated_code, sql_equivalent) ou None.
+    """
+    cached_code = await run_blocking(code_cache.get, request.question, signature)
+    if cached_code is None:
+        return None
     try:
-        session_data = session_manager.get_session_data(request.session_id)
-        answer = None
-        generated_code = None
+        if session_data["type"] == "dataframe":
+            return await aexecute_cached_pandas_code(session_data["dataframe"], cached_code["code"])
+        answer, generated_code = await run_blocking(
+            execute_cached_sql, session_data["engine_instance"], cached_code["code"]
+        )
+        return answer, generated_code, None
+    except Exception as e:
+        print(f"Falha ao reexecutar código em cache, consultando o LLM: {e}")
+        return None
+
+async def _query_database(request: QueryRequest):
+    sql_query_engine = await run_blocking(session_manager.get_query_engine, request.session_id)
+    if sql_query_engine is None:
+        raise HTTPException(status_code=500, detail="Falha ao obter o motor de consulta SQL.")
+    # O caminho assíncrono do NLSQLTableQueryEngine executa o SQL dentro da
+    # corrotina, então a consulta inteira vai para o pool
+    return await run_blocking(query_database_engine, sql_query_engine, request.question)
+
+async def _store_query_result(request: QueryRequest, fingerprint: Optional[str], signature: Optional[str],
+                              answer: str, generated_code: Optional[str], sql_equivalent: Optional[str],
+                              cache_code: bool) -> Dict[str, Any]:
+    """Grava a resposta (e o código gerado) nos caches e no histórico da sessão."""
+    if cache_code and generated_code:
+        await run_blocking(code_cache.set, request.question, signature, {"code": generated_code})
+
+    result = {
+        "answer": answer,
+        "generated_code": generated_code,
+        "sql_equivalent": sql_equivalent
+    }
+    await run_blocking(answer_cache.set, request.question, fingerprint, result)
+
+    # Adicionar ao histórico
+    await run_blocking(session_manager.add_history, request.session_id, request.question, answer, generated_code)
+    print(f"Consulta para sessão {request.session_id} respondida.")
+    return result
+
+async def _answer_query(request: QueryRequest, session_data: Dict[str, Any]) -> Dict[str, Any]:
+    """Responde uma pergunta: cache de respostas, depois código em cache, depois o LLM."""
+    fingerprint, cached = await _lookup_cached_answer(request, session_data)
+    if cached is not None:
+        return {**cached, "cached": True}
+
+    signature = await run_blocking(schema_signature, session_data)
+    reused = await _reuse_cached_code(request, session_data, signature)
+    if reused is not None:
+        answer, generated_code, sql_equivalent = reused
+    elif session_data["type"] == "dataframe":
+        pandas_query_engine = await run_blocking(session_manager.get_query_engine, request.session_id)
+        answer, generated_code, sql_equivalent = await aquery_dataframe(
+            session_data["dataframe"], request.question,
+            query_engine=pandas_query_engine,
+            data_context=session_data["data_context"]
+        )
+    elif session_data["type"] == "database":
+        answer, generated_code = await _query_database(request)
         sql_equivalent = None
+    else:
+        raise HTTPException(status_code=400, detail="Tipo de sessão inválida para consulta.")
+
+    result = await _store_query_result(request, fingerprint, signature, answer, generated_code,
+                                       sql_equivalent, cache_code=reused is None)
+    return {**result, "cached": False, "reused_code": reused is not None}
+
+@app.post("/sql", summary="Executa uma consulta SELECT validada no banco da sessão", dependencies=[Depends(admit_query)])
+async def execute_sql(request: SQLRequest):
+    """
+    O resultado é montado em colunas (Arrow) a partir do cursor, em lotes.
+    Com format=arrow a resposta é um stream Arrow IPC
+    (application/vnd.apache.arrow.stream); caso contrário, JSON. A consulta
+    é interrompida ao estourar o prazo (504) ou ser cancelada (409).
+    """
+    session_data = await run_blocking(session_manager.get_session_data, request.session_id)
+    if session_data["type"] != "database":
+        raise HTTPException(status_code=400, detail="A sessão não é de banco de dados.")
+    control = query_registry.start(request.session_id, request.query_id, request.timeout_seconds)
+    result = await run_with_control(control, run_blocking(
+        secure_db_connector.execute_safe_query, session_data["engine_instance"], request.sql, request.format
+    ))
+    if request.format == "arrow":
+        return Response(content=result, media_type="application/vnd.apache.arrow.stream")
+    return result
+
+@app.post("/sql/stream", summary="Executa uma consulta SELECT e transmite o resultado em lotes (NDJSON, CSV ou Arrow)")
+async def stream_sql(request: SQLStreamRequest):
+    """
+    O cursor permanece aberto durante a resposta e as linhas são enviadas à
+    medida que são lidas, respeitando os limites de linhas e bytes do servidor.
+    O prazo vale para o stream inteiro: ao estourar (ou com cancelamento), a
+    leitura é interrompida e, no NDJSON, a última linha indica o motivo.
+    """
+    if request.format not in STREAM_MEDIA_TYPES:
+        raise HTTPException(status_code=400, detail=f"Formato de streaming inválido: {request.format}")
+    session_data = await run_blocking(session_manager.get_session_data, request.session_id)
+    if session_data["type"] != "database":
+        raise HTTPException(status_code=400, detail="A sessão não é de banco de dados.")
+    # Valida antes de abrir o stream, para que erros voltem como status HTTP
+    secure_db_connector.validate_sql_query(request.sql, apply_limit=False)
+
+    # A vaga e o registro da consulta são liberados só quando a resposta termina
+    # (ver StreamingResponseWithCleanup)
+    query_admission.acquire()
+    try:
+        control = query_registry.start(request.session_id, request.query_id, request.timeout_seconds)
+    except Exception:
+        query_admission.release()
+        raise
+
+    def release():
+        query_registry.finish(control)
+        query_admission.release()
+
+    async def chunks():
+        # Contexto da task do stream: run_blocking leva a consulta atual às threads,
+        # onde o handler de progresso do SQLite aplica o prazo e o cancelamento
+        current_query.set(control)
+        iterator = secure_db_connector.stream_safe_query(
+            session_data["engine_instance"], request.sql, request.format, max_rows=request.max_rows
+        )
+        try:
+            while True:
+                chunk = await run_blocking(next, iterator, None)
+                if chunk is None:
+                    break
+                if chunk:
+                    yield chunk
+        finally:
+            await run_blocking(iterator.close)
+
+    return StreamingResponseWithCleanup(
+        chunks(),
+        on_close=release,
+        media_type=STREAM_MEDIA_TYPES[request.format],
+        headers={
+            "X-Max-Rows": str(secure_db_connector.stream_row_limit(request.max_rows)),
+            "X-Max-Bytes": str(secure_db_connector.stream_max_bytes)
+        }
+    )
+
+@app.get("/table_previews", summary="Pré-visualização paginada das tabelas de uma sessão de banco de dados")
+async def get_table_previews(session_id: str,
+                             tables: Optional[str] = None,
+                             page: int = 1,
+                             page_size: int = 20,
+                             rows: int = 5,
+                             offset: int = 0):
+    """
+    Busca sob demanda o preview das tabelas (todas ou as informadas em `tables`,
+    separadas por vírgula), uma página de tabelas por vez, em paralelo e com
+    cache por tabela. `rows`/`offset` paginam as linhas de cada tabela.
+    """
+    session_data = await run_blocking(session_manager.get_session_data, session_id)
+    if session_data["type"] != "database":
+        raise HTTPException(status_code=400, detail="A sessão não é de banco de dados.")
+    if page < 1 or page_size < 1 or offset < 0 or not 1 <= rows <= MAX_PREVIEW_ROWS:
+        raise HTTPException(status_code=400, detail=f"Parâmetros de paginação inválidos (rows entre 1 e {MAX_PREVIEW_ROWS}).")
+
+    available = session_data["tables"]
+    if tables:
+        requested = [t.strip() for t in tables.split(",") if t.strip()]
+        unknown = [t for t in requested if t not in available]
+        if unknown:
+            raise HTTPException(status_code=404, detail=f"Tabelas não encontradas: {', '.join(unknown)}")
+    else:
+        requested = available
+    page_size = min(page_size, MAX_PREVIEW_PAGE_SIZE)
+    page_tables = requested[(page - 1) * page_size:page * page_size]
+
+    semaphore = asyncio.Semaphore(PREVIEW_CONCURRENCY)
+
+    async def fetch(table: str):
+        async with semaphore:
+            return await run_blocking(get_cached_table_preview, session_data["engine_instance"],
+                                      session_data["db_path"], table, rows, offset)
+
+    previews = await asyncio.gather(*(fetch(table) for table in page_tables))
+    return {
+        "session_id": session_id,
+        "page": page,
+        "page_size": page_size,
+        "total_tables": len(requested),
+        "previews": dict(zip(page_tables, previews))
+    }
+
+@app.post("/query", summary="Executa uma pergunta sobre os dados carregados", dependencies=[Depends(admit_query)])
+async def execute_query(request: QueryRequest):
+    # Nada aqui bloqueia o event loop: o LLM é chamado de forma assíncrona e o
+    # trabalho de Pandas/SQL/disco roda no pool limitado de app.executor
+    print(f"Recebida query para sessão {request.session_id}: {request.question[:50]}...")
+    control = query_registry.start(request.session_id, request.query_id, request.timeout_seconds)
 
-        if session_data["type"] == "dataframe":
-            df = session_data["dataframe"]
-            answer, generated_code, sql_equivalent = query_dataframe(df, request.question)
-        elif session_data["type"] == "database":
-            sql_query_engine = session_manager.get_query_engine(request.session_id)
-            if sql_query_engine is None:
-                raise HTTPException(status_code=500, detail="Falha ao obter o motor de consulta SQL.")
-            answer, generated_code = query_database_engine(sql_query_engine, request.question)
-        else:
-            raise HTTPException(status_code=400, detail="Tipo de sessão inválida para consulta.")
+    async def answer() -> Dict[str, Any]:
+        session_data = await run_blocking(session_manager.get_session_data, request.session_id)
+        return await _answer_query(request, session_data)
 
-        # Adicionar ao histórico
-        session_manager.add_history(request.session_id, request.question, answer, generated_code)
-        print(f"Consulta para sessão {request.session_id} respondida.")
-        
-        return {
-            "answer": answer,
-            "generated_code": generated_code,
-            "sql_equivalent": sql_equivalent
-        }
+    try:
+        result = await run_with_control(control, answer())
+        return {**result, "query_id": control.query_id}
 
     except HTTPException as http_exc:
         raise http_exc
@@ -247,6 +515,168 @@ async def execute_query(request: QueryRequest):
         print(f"Erro inesperado durante a consulta na sessão {request.session_id}: {e}")
         raise HTTPException(status_code=500, detail=f"Erro interno ao processar a consulta: {e}")
 
+@app.post("/query/batch", summary="Executa várias perguntas sobre a mesma sessão em uma única chamada", dependencies=[Depends(admit_query)])
+async def execute_batch_query(request: BatchQueryRequest):
+    """
+    Responde as perguntas com a mesma sessão, engine e perfil dos dados,
+    executando até max_concurrency consultas ao LLM em paralelo. Os resultados
+    seguem a ordem das perguntas (repetidas são respondidas uma vez); uma falha
+    não interrompe as demais. Cada pergunta tem o seu prazo; cancelar o query_id
+    do lote interrompe as que ainda estiverem em andamento.
+    """
+    if not request.questions:
+        raise HTTPException(status_code=400, detail="Nenhuma pergunta informada.")
+    if len(request.questions) > BATCH_MAX_QUESTIONS:
+        raise HTTPException(status_code=400, detail=f"Máximo de {BATCH_MAX_QUESTIONS} perguntas por lote.")
+    concurrency = max(1, min(request.max_concurrency or BATCH_QUERY_CONCURRENCY, BATCH_QUERY_CONCURRENCY))
+    print(f"Recebido lote de {len(request.questions)} perguntas para sessão {request.session_id} (concorrência {concurrency})")
+
+    batch_start = time.perf_counter()
+    session_data = await run_blocking(session_manager.get_session_data, request.session_id)
+    # Prepara engine e perfil dos dados uma vez para todo o lote
+    await run_blocking(session_manager.get_query_engine, request.session_id)
+    setup_ms = (time.perf_counter() - batch_start) * 1000
+
+    semaphore = asyncio.Semaphore(concurrency)
+    # O lote só é limitado pelo prazo máximo; cada pergunta tem o prazo informado
+    batch_control = query_registry.start(request.session_id, request.query_id, float("inf"))
+
+    async def answer(index: int, question: str) -> Dict[str, Any]:
+        queued = time.perf_counter()
+        async with semaphore:
+            started = time.perf_counter()
+            try:
+                control = query_registry.child(batch_control, index, request.timeout_seconds)
+                if control.should_stop():
+                    raise control.to_http_exception()
+                result = await run_with_control(
+                    control, _answer_query(QueryRequest(session_id=request.session_id, question=question), session_data)
+                )
+                item = {"question": question, **result, "error": None}
+            except HTTPException as http_exc:
+                item = {"question": question, "answer": None, "error": http_exc.detail}
+            except Exception as e:
+                print(f"Erro inesperado no lote da sessão {request.session_id}: {e}")
+                item = {"question": question, "answer": None, "error": f"Erro interno ao processar a consulta: {e}"}
+            item["timing"] = {
+                "wait_ms": round((started - queued) * 1000, 1),
+                "elapsed_ms": round((time.perf_counter() - started) * 1000, 1)
+            }
+            return item
+
+    # Perguntas repetidas no lote (após normalização) são respondidas uma única vez
+    tasks: Dict[str, asyncio.Task] = {}
+    try:
+        for question in request.questions:
+            key = normalize_question(question)
+            if key not in tasks:
+                tasks[key] = asyncio.ensure_future(answer(len(tasks), question))
+        await asyncio.gather(*tasks.values())
+    finally:
+        query_registry.finish(batch_control)
+    results = [
+        {**tasks[normalize_question(question)].result(), "question": question}
+        for question in request.questions
+    ]
+    return {
+        "session_id": request.session_id,
+        "query_id": batch_control.query_id,
+        "results": results,
+        "timing": {
+            "setup_ms": round(setup_ms, 1),
+            "total_ms": round((time.perf_counter() - batch_start) * 1000, 1),
+            "concurrency": concurrency
+        }
+    }
+
+def _sse_event(event: str, data: Dict[str, Any]) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False, default=str)}\n\n"
+
+@app.post("/query/stream", summary="Executa uma pergunta e envia o progresso como Server-Sent Events")
+async def stream_query(request: QueryRequest):
+    """
+    Variante em streaming de /query. Eventos enviados, na ordem:
+    "token" (trechos da instrução gerada pelo LLM, apenas para DataFrames),
+    "code" (instrução/SQL completo), "result" (mesmo corpo de /query) ou "error".
+    O primeiro evento, "query", traz o query_id usado para cancelar a consulta.
+    """
+    print(f"Recebida query (stream) para sessão {request.session_id}: {request.question[:50]}...")
+    # A vaga e o registro da consulta são liberados só quando a resposta termina
+    query_admission.acquire()
+    control = None
+
+    def release():
+        if control is not None:
+            query_registry.finish(control)
+        query_admission.release()
+
+    try:
+        session_data = await run_blocking(session_manager.get_session_data, request.session_id)
+        control = query_registry.start(request.session_id, request.query_id, request.timeout_seconds)
+    except Exception:
+        release()
+        raise
+
+    async def query_events():
+        yield _sse_event("query", {"query_id": control.query_id, "timeout_seconds": control.timeout_seconds})
+        fingerprint, cached = await _lookup_cached_answer(request, session_data)
+        if cached is not None:
+            yield _sse_event("code", {"generated_code": cached.get("generated_code"), "sql_equivalent": cached.get("sql_equivalent")})
+            yield _sse_event("result", {**cached, "cached": True})
+            return
+
+        signature = await run_blocking(schema_signature, session_data)
+        reused = await _reuse_cached_code(request, session_data, signature)
+        if reused is not None:
+            answer, generated_code, sql_equivalent = reused
+            yield _sse_event("code", {"generated_code": generated_code, "sql_equivalent": sql_equivalent})
+        elif session_data["type"] == "dataframe":
+            pandas_query_engine = await run_blocking(session_manager.get_query_engine, request.session_id)
+            answer = generated_code = sql_equivalent = None
+            async for event, data in astream_dataframe_query(
+                session_data["dataframe"], request.question,
+                query_engine=pandas_query_engine,
+                data_context=session_data["data_context"]
+            ):
+                if event == "result":
+                    answer, generated_code, sql_equivalent = data["answer"], data["generated_code"], data["sql_equivalent"]
+                else:
+                    yield _sse_event(event, data)
+        elif session_data["type"] == "database":
+            answer, generated_code = await _query_database(request)
+            sql_equivalent = None
+            yield _sse_event("code", {"generated_code": generated_code, "sql_equivalent": None})
+        else:
+            raise HTTPException(status_code=400, detail="Tipo de sessão inválida para consulta.")
+
+        result = await _store_query_result(request, fingerprint, signature, answer, generated_code,
+                                           sql_equivalent, cache_code=reused is None)
+        yield _sse_event("result", {**result, "cached": False, "reused_code": reused is not None})
+
+    async def events():
+        try:
+            async for event in stream_with_control(control, query_events()):
+                yield event
+        except HTTPException as http_exc:
+            yield _sse_event("error", {"status_code": http_exc.status_code, "detail": http_exc.detail})
+        except Exception as e:
+            print(f"Erro inesperado durante a consulta (stream) na sessão {request.session_id}: {e}")
+            yield _sse_event("error", {"status_code": 500, "detail": f"Erro interno ao processar a consulta: {e}"})
+
+    return StreamingResponseWithCleanup(
+        events(),
+        on_close=release,
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.post("/query/{query_id}/cancel", summary="Cancela uma consulta em andamento")
+async def cancel_query(query_id: str):
+    """Interrompe a consulta (ou o lote): o SQL em execução é abortado e o processo Pandas encerrado."""
+    if not query_registry.cancel(query_id):
+        raise HTTPException(status_code=404, detail=f"Consulta {query_id} não encontrada ou já finalizada.")
+    return {"query_id": query_id, "cancelled": True}
+
 # --- Endpoint de Geração de PDF (a implementar) ---
 
 @app.post("/generate_pdf", summary="Gera um relatório PDF com interações selecionadas")
@@ -274,6 +704,42 @@ async def generate_pdf_report(request: PdfRequest):
         print(f"Erro ao gerar PDF para sessão {request.session_id}: {e}")
         raise HTTPException(status_code=500, detail=f"Erro interno ao gerar o relatório PDF: {e}")
 
+@app.get("/admin/sessions", summary="Uso de memória e despejos do armazenamento de sessões")
+async def get_sessions_stats(authorized: bool = Depends(verify_api_key)):
+    return session_manager.sessions.stats()
+
+@app.get("/admin/llm_clients", summary="Clientes LLM compartilhados e limites do pool HTTP")
+async def get_llm_clients_stats(authorized: bool = Depends(verify_api_key)):
+    return llm_registry.stats()
+
+@app.get("/admin/answer_cache", summary="Estatísticas dos caches de respostas e de código gerado")
+async def get_answer_cache_stats(authorized: bool = Depends(verify_api_key)):
+    return {"answers": answer_cache.stats(), "generated_code": code_cache.stats()}
+
+@app.get("/admin/sql_engines", summary="Engines SQL compartilhadas e ocupação dos pools de conexões")
+async def get_sql_engine_stats(authorized: bool = Depends(verify_api_key)):
+    return engine_registry.stats()
+
+@app.get("/admin/sql_query_engines", summary="Cache de query engines SQL compartilhados entre sessões")
+async def get_sql_query_engine_stats(authorized: bool = Depends(verify_api_key)):
+    return sql_query_engine_cache.stats()
+
+@app.get("/admin/schema_catalog", summary="Catálogo de schemas dos bancos conectados")
+async def get_schema_catalog_stats(authorized: bool = Depends(verify_api_key)):
+    return schema_catalog.stats()
+
+@app.get("/admin/sql_validator", summary="Cache de vereditos do validador de SQL")
+async def get_sql_validator_stats(authorized: bool = Depends(verify_api_key)):
+    return sql_validator.stats()
+
+@app.get("/admin/executor", summary="Ocupação dos pools de execução e consultas recusadas (429)")
+async def get_executor_stats(authorized: bool = Depends(verify_api_key)):
+    return executor_stats()
+
+@app.get("/admin/queries", summary="Consultas em andamento, prazos e contagem de timeouts/cancelamentos")
+async def get_queries_stats(authorized: bool = Depends(verify_api_key)):
+    return query_registry.stats()
+
 @app.get("/", summary="Endpoint raiz")
 async def read_root():
     return {"message": "Bem-vindo à API de Análise de Dados com IA"}
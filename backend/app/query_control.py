@@ -0,0 +1,202 @@
+# backend/app/query_control.py
+
+import os
+import time
+import uuid
+import asyncio
+import threading
+import logging
+import contextvars
+from contextvars import ContextVar
+from typing import Dict, Any, Optional
+
+from fastapi import HTTPException
+
+# Configurar logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+QUERY_TIMEOUT_SECONDS = float(os.getenv("QUERY_TIMEOUT_SECONDS", 120))
+QUERY_MAX_TIMEOUT_SECONDS = float(os.getenv("QUERY_MAX_TIMEOUT_SECONDS", 600))
+# A cada quantas instruções da VM do SQLite o prazo/cancelamento é verificado
+SQLITE_PROGRESS_INTERVAL = int(os.getenv("SQLITE_PROGRESS_INTERVAL", 10000))
+
+class QueryControl:
+    """
+    Prazo e sinal de cancelamento de uma consulta em execução.
+
+    É propagado para as threads do executor via contextvar (current_query);
+    o handler de progresso do SQLite e o pool de processos do Pandas o
+    consultam para interromper o trabalho.
+    """
+
+    def __init__(self, query_id: str, session_id: str, timeout_seconds: float,
+                 parent: Optional["QueryControl"] = None):
+        self.query_id = query_id
+        self.session_id = session_id
+        self.timeout_seconds = timeout_seconds
+        self.started_at = time.time()
+        self.deadline = time.monotonic() + timeout_seconds
+        self.parent = parent
+        self.children = []
+        if parent is not None:
+            parent.children.append(self)
+        self._cancelled = threading.Event()
+        self.finished = False
+        self._task: Optional[asyncio.Task] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancelled.is_set() or (self.parent is not None and self.parent.cancelled)
+
+    @property
+    def expired(self) -> bool:
+        return time.monotonic() > self.deadline or (self.parent is not None and self.parent.expired)
+
+    def should_stop(self) -> bool:
+        return self.cancelled or self.expired
+
+    def remaining(self) -> float:
+        return max(0.0, self.deadline - time.monotonic())
+
+    def attach(self, task: asyncio.Task):
+        """Associa a task asyncio que executa a consulta (cancelada junto)."""
+        self._task = task
+        self._loop = task.get_loop()
+
+    def cancel(self):
+        self._cancelled.set()
+        if self._task is not None and self._loop is not None:
+            self._loop.call_soon_threadsafe(self._task.cancel)
+        for child in list(self.children):
+            child.cancel()
+
+    def to_http_exception(self) -> HTTPException:
+        if self.cancelled:
+            return HTTPException(status_code=409, detail=f"Consulta {self.query_id} cancelada.")
+        return HTTPException(status_code=504, detail=f"Tempo limite da consulta excedido ({self.timeout_seconds:.0f}s).")
+
+    def info(self) -> Dict[str, Any]:
+        return {
+            "query_id": self.query_id,
+            "session_id": self.session_id,
+            "started_at": self.started_at,
+            "timeout_seconds": self.timeout_seconds,
+            "remaining_seconds": round(self.remaining(), 1),
+            "cancelled": self.cancelled
+        }
+
+# Consulta em execução no contexto atual (copiado para as threads por run_blocking)
+current_query: ContextVar[Optional[QueryControl]] = ContextVar("current_query", default=None)
+
+class QueryRegistry:
+    """Consultas em andamento, por query_id, para listagem e cancelamento."""
+
+    def __init__(self):
+        self._queries: Dict[str, QueryControl] = {}
+        self._lock = threading.Lock()
+        self.timeouts = 0
+        self.cancellations = 0
+
+    def start(self, session_id: str, query_id: Optional[str] = None,
+              timeout_seconds: Optional[float] = None) -> QueryControl:
+        query_id = query_id or str(uuid.uuid4())
+        timeout = min(timeout_seconds or QUERY_TIMEOUT_SECONDS, QUERY_MAX_TIMEOUT_SECONDS)
+        control = QueryControl(query_id, session_id, timeout)
+        with self._lock:
+            if query_id in self._queries:
+                raise HTTPException(status_code=409, detail=f"Já existe uma consulta em andamento com o id {query_id}.")
+            self._queries[query_id] = control
+        return control
+
+    def child(self, parent: QueryControl, index: int, timeout_seconds: Optional[float] = None) -> QueryControl:
+        """Subconsulta (ex.: uma pergunta de um lote), cancelada junto com a consulta pai."""
+        timeout = min(timeout_seconds or QUERY_TIMEOUT_SECONDS, QUERY_MAX_TIMEOUT_SECONDS)
+        return QueryControl(f"{parent.query_id}:{index}", parent.session_id, timeout, parent=parent)
+
+    def finish(self, control: QueryControl):
+        """Remove a consulta do registro; chamadas repetidas são ignoradas."""
+        with self._lock:
+            if control.finished:
+                return
+            control.finished = True
+            if self._queries.get(control.query_id) is control:
+                del self._queries[control.query_id]
+            if control.cancelled:
+                self.cancellations += 1
+            elif control.expired:
+                self.timeouts += 1
+
+    def cancel(self, query_id: str) -> bool:
+        with self._lock:
+            control = self._queries.get(query_id)
+        if control is None:
+            return False
+        logger.info(f"Cancelando consulta {query_id}")
+        control.cancel()
+        return True
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            running = [control.info() for control in self._queries.values()]
+        return {
+            "running": running,
+            "default_timeout_seconds": QUERY_TIMEOUT_SECONDS,
+            "max_timeout_seconds": QUERY_MAX_TIMEOUT_SECONDS,
+            "timeouts": self.timeouts,
+            "cancellations": self.cancellations
+        }
+
+# Instância global do registro de consultas
+query_registry = QueryRegistry()
+
+async def _run_step(control: QueryControl, awaitable):
+    # A task roda num contexto próprio com a consulta atual definida; run_blocking
+    # o copia para as threads do executor
+    context = contextvars.copy_context()
+    context.run(current_query.set, control)
+    task = asyncio.get_running_loop().create_task(awaitable, context=context)
+    control.attach(task)
+    try:
+        return await asyncio.wait_for(task, timeout=control.remaining())
+    except asyncio.TimeoutError:
+        raise control.to_http_exception()
+    except asyncio.CancelledError:
+        if control.cancelled:
+            raise control.to_http_exception()
+        raise
+    except StopAsyncIteration:
+        raise
+    except Exception:
+        # Erros causados pela interrupção (SQLite, processo encerrado) viram 504/409
+        if control.should_stop():
+            raise control.to_http_exception()
+        raise
+
+async def run_with_control(control: QueryControl, coro):
+    """
+    Executa a corrotina da consulta sob o prazo do QueryControl, registrando-a
+    para cancelamento. Timeout vira 504 e cancelamento vira 409.
+    """
+    try:
+        return await _run_step(control, coro)
+    finally:
+        query_registry.finish(control)
+
+async def stream_with_control(control: QueryControl, events):
+    """Variante de run_with_control para geradores assíncronos (ex.: eventos SSE)."""
+    try:
+        while True:
+            try:
+                yield await _run_step(control, events.__anext__())
+            except StopAsyncIteration:
+                break
+    finally:
+        await events.aclose()
+        query_registry.finish(control)
+
+def sqlite_progress_handler() -> int:
+    """Handler de progresso do SQLite: um valor diferente de zero interrompe a consulta."""
+    control = current_query.get()
+    return 1 if control is not None and control.should_stop() else 0
@@ -1,13 +1,15 @@
 # backend/app/query_engine.py
 
 import os
+import asyncio
 import pandas as pd
 import numpy as np
-from llama_index.llms.openai import OpenAI
 from llama_index.core import Settings
 from fastapi import HTTPException
 import logging
-from typing import Tuple, List, Dict, Any
+from typing import Tuple, List, Dict, Any, AsyncIterator
+
+from app.llm_registry import get_llm
 
 # Configurar logging
 logging.basicConfig(
@@ -21,15 +23,14 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 def get_enhanced_llm():
-    """Configuração do LLM com parâmetros otimizados"""
+    """Configuração do LLM com parâmetros otimizados (cliente compartilhado pelo processo)"""
     api_key = os.getenv("OPENAI_API_KEY")
     if not api_key:
         raise HTTPException(status_code=500, detail="LLM não configurado. Verifique a chave da API OpenAI.")
     
     try:
-        return OpenAI(
+        return get_llm(
             model="gpt-3.5-turbo",
-            api_key=api_key,
             temperature=0.1,
             max_tokens=2000,
             system_prompt="""Você é um assistente especializado em análise de dados que fornece respostas estruturadas e visualmente organizadas.
@@ -60,9 +61,8 @@ Lembre-se:
     except Exception as e:
         logger.error(f"Erro ao inicializar OpenAI com configuração principal: {e}")
         try:
-            return OpenAI(
+            return get_llm(
                 model="gpt-3.5-turbo",
-                api_key=api_key,
                 temperature=0.3
             )
         except Exception as e:
@@ -157,100 +157,261 @@ def format_response(response_text: str) -> str:
     
     return "\n".join(formatted_lines)
 
-def query_dataframe(df: pd.DataFrame, question: str):
-    """Executa uma consulta em linguagem natural sobre um DataFrame Pandas."""
+def frame_answer(formatted_answer: str) -> str:
+    """Adiciona bordas decorativas à resposta formatada."""
+    # Adicionar bordas decorativas mais leves
+    border_top = "╭" + "─" * 58 + "╮"
+    border_bottom = "╰" + "─" * 58 + "╯"
+    
+    # Formatar cada linha com borda lateral
+    formatted_lines = []
+    for line in formatted_answer.split("\n"):
+        if line.strip():
+            formatted_lines.append(f"│ {line.ljust(57)}│")
+        else:
+            formatted_lines.append(f"│{''.ljust(58)}│")
+            
+    # Montar resposta final
+    return f"{border_top}\n" + "\n".join(formatted_lines) + f"\n{border_bottom}"
+
+def execute_cached_pandas_code(df: pd.DataFrame, code: str):
+    """
+    Reexecuta localmente uma instrução Pandas gerada anteriormente pelo LLM
+    (mesmo avaliador restrito de run_pandas_instruction).
+    """
+    return _build_cached_code_answer(code, run_pandas_instruction(df, code))
+
+async def aexecute_cached_pandas_code(df: pd.DataFrame, code: str):
+    """Versão assíncrona de execute_cached_pandas_code (execução via app.executor)."""
+    from app.executor import run_blocking, run_pandas
+    output = await run_pandas(df, code)
+    return await run_blocking(_build_cached_code_answer, code, output)
+
+def _build_cached_code_answer(code: str, output: Any):
+    if isinstance(output, str) and output.startswith("There was an error running the output as Python code"):
+        raise ValueError(output)
+    answer = str(output) if output else "⚠️ Não foi possível obter uma resposta."
+    logger.info(f"Código em cache reexecutado: {code}")
+    return frame_answer(format_response(answer)), code, generate_sql_equivalent(code)
+
+def build_data_context(df: pd.DataFrame) -> Dict[str, Any]:
+    """Calcula uma única vez o perfil do DataFrame usado no prompt e nos logs."""
+    return {
+        "columns": list(df.columns),
+        "types": df.dtypes.to_dict(),
+        "sample_size": len(df),
+        "null_counts": df.isnull().sum().to_dict(),
+        "numeric_columns": df.select_dtypes(include=[np.number]).columns.tolist(),
+        "categorical_columns": df.select_dtypes(include=['object']).columns.tolist()
+    }
+
+def _has_read_only_columns(df: pd.DataFrame) -> bool:
+    """Colunas numpy somente leitura (ex.: sessão recarregada do disco por memory map)."""
+    return any(
+        isinstance(dtype, np.dtype) and not df.iloc[:, i].to_numpy(copy=False).flags.writeable
+        for i, dtype in enumerate(df.dtypes)
+    )
+
+def run_pandas_instruction(df: pd.DataFrame, instruction: str) -> str:
+    """
+    Executa a instrução Pandas gerada pelo LLM no avaliador restrito
+    (safe_eval/safe_exec) do PandasQueryEngine; o código só enxerga df, pd e np.
+
+    Um DataFrame mapeado do disco é copiado antes, para que instruções que
+    alteram df no lugar funcionem como antes do despejo da sessão.
+    """
+    from llama_index.experimental.query_engine.pandas.output_parser import default_output_processor
+    if _has_read_only_columns(df):
+        df = df.copy()
+    return default_output_processor(instruction, df)
+
+def create_pandas_query_engine(df: pd.DataFrame, data_context: Dict[str, Any]):
+    """
+    Cria o PandasQueryEngine de um DataFrame (reutilizável entre perguntas).
+
+    O engine apenas gera a instrução; a execução é feita depois por
+    run_pandas_instruction, o que permite executá-la fora do event loop.
+    """
+    from llama_index.experimental.query_engine import PandasQueryEngine
+    from llama_index.experimental.query_engine.pandas import PandasInstructionParser
+
+    class DeferredInstructionParser(PandasInstructionParser):
+        def parse(self, output: str) -> Any:
+            return output
+
+    return PandasQueryEngine(
+        df=df,
+        llm=get_enhanced_llm(),
+        verbose=True,
+        instruction_parser=DeferredInstructionParser(df),
+        metadata=data_context
+    )
+
+def _table_context(df: pd.DataFrame, head: int = 5) -> str:
+    """Amostra do DataFrame no prompt, no mesmo formato usado pelo PandasQueryEngine."""
+    with pd.option_context("display.max_colwidth", None, "display.max_columns", None,
+                           "display.max_rows", head, "display.width", None):
+        return str(df.head(head))
+
+def _log_data_context(df: pd.DataFrame, data_context: Dict[str, Any]):
+    # Log do estado dos dados
+    logger.info(f"Dados recebidos - Shape: {df.shape}")
+    logger.info(f"Colunas: {data_context['columns']}")
+    logger.info(f"Tipos de dados: {data_context['types']}")
+    logger.info(f"Valores nulos por coluna: {data_context['null_counts']}")
+
+def _extract_generated_code(response) -> str:
+    if response.metadata:
+        if 'pandas_instruction_str' in response.metadata:
+            return response.metadata['pandas_instruction_str']
+        elif 'code' in response.metadata:
+            return response.metadata['code']
+    return None
+
+def _build_dataframe_answer(question: str, output: str, generated_code: str):
+    """Formata o resultado da instrução executada e monta a resposta final."""
+    # Processar resposta
+    answer = str(output) if output else "⚠️ Não foi possível obter uma resposta."
+    sql_equivalent = generate_sql_equivalent(generated_code) if generated_code else None
+    
+    # Log detalhado da resposta bruta
+    logger.info("=== RESPOSTA BRUTA DA IA ===")
+    logger.info(f"Pergunta: {question}")
+    logger.info(f"Resposta: {answer}")
+    
+    # Formatar a resposta principal
+    formatted_answer = frame_answer(format_response(answer))
+    
+    # Log da resposta formatada
+    logger.info("=== RESPOSTA FORMATADA ===")
+    logger.info("\n" + formatted_answer)
+
+    # Log da resposta
+    logger.info(f"Pergunta processada: {question}")
+    logger.info(f"Código gerado: {generated_code}")
+    logger.info(f"SQL equivalente: {sql_equivalent}")
+    
+    return formatted_answer, generated_code, sql_equivalent
+
+def _llm_error_to_http(e: Exception) -> HTTPException:
+    logger.error(f"Erro ao processar consulta: {e}")
+    error_msg = str(e)
+    if "AuthenticationError" in error_msg:
+        error_msg = "Erro de autenticação com a API OpenAI. Verifique sua chave."
+    elif "RateLimitError" in error_msg:
+        error_msg = "Limite de taxa da API OpenAI atingido. Tente novamente mais tarde."
+    elif "invalid_request_error" in error_msg:
+        error_msg = "Erro na requisição à API. Verifique as configurações do modelo."
+    
+    return HTTPException(status_code=500, detail=error_msg)
+
+def query_dataframe(df: pd.DataFrame, question: str, query_engine=None, data_context: Dict[str, Any] = None):
+    """
+    Executa uma consulta em linguagem natural sobre um DataFrame Pandas.
+
+    query_engine e data_context podem vir da sessão para evitar reconstruí-los
+    (e reprocessar o DataFrame inteiro) a cada pergunta.
+    """
     if df is None or df.empty:
         raise HTTPException(status_code=400, detail="Nenhum dado carregado para consulta.")
 
     try:
-        # Log do estado dos dados
-        logger.info(f"Dados recebidos - Shape: {df.shape}")
-        logger.info(f"Colunas: {df.columns.tolist()}")
-        logger.info(f"Tipos de dados: {df.dtypes.to_dict()}")
-        logger.info(f"Valores nulos por coluna: {df.isnull().sum().to_dict()}")
+        if data_context is None:
+            data_context = build_data_context(df)
+        _log_data_context(df, data_context)
 
-        llm = get_enhanced_llm()
-        
-        # Preparar contexto detalhado dos dados
-        data_context = {
-            "columns": list(df.columns),
-            "types": df.dtypes.to_dict(),
-            "sample_size": len(df),
-            "null_counts": df.isnull().sum().to_dict(),
-            "numeric_columns": df.select_dtypes(include=[np.number]).columns.tolist(),
-            "categorical_columns": df.select_dtypes(include=['object']).columns.tolist()
-        }
-        
         # Usar PandasQueryEngine com contexto aprimorado
-        from llama_index.experimental.query_engine import PandasQueryEngine
-        query_engine = PandasQueryEngine(
-            df=df,
-            llm=llm,
-            verbose=True,
-            metadata=data_context
-        )
+        if query_engine is None:
+            query_engine = create_pandas_query_engine(df, data_context)
         
-        # Executar consulta
+        # Gerar a instrução com o LLM e executá-la sobre o DataFrame
         response = query_engine.query(question)
+        generated_code = _extract_generated_code(response)
+        output = run_pandas_instruction(df, generated_code) if generated_code else response.response
         
-        # Processar resposta
-        answer = str(response.response) if response.response else "⚠️ Não foi possível obter uma resposta."
-        
-        # Extrair e formatar o código gerado
-        generated_code = None
-        sql_equivalent = None
-        
-        if response.metadata:
-            if 'pandas_instruction_str' in response.metadata:
-                generated_code = response.metadata['pandas_instruction_str']
-                sql_equivalent = generate_sql_equivalent(generated_code)
-            elif 'code' in response.metadata:
-                generated_code = response.metadata['code']
-                sql_equivalent = generate_sql_equivalent(generated_code)
-        
-        # Log detalhado da resposta bruta
-        logger.info("=== RESPOSTA BRUTA DA IA ===")
-        logger.info(f"Pergunta: {question}")
-        logger.info(f"Resposta: {answer}")
-        
-        # Formatar a resposta principal
-        formatted_answer = format_response(answer)
-        
-        # Adicionar bordas decorativas mais leves
-        border_top = "╭" + "─" * 58 + "╮"
-        border_bottom = "╰" + "─" * 58 + "╯"
-        
-        # Formatar cada linha com borda lateral
-        formatted_lines = []
-        for line in formatted_answer.split("\n"):
-            if line.strip():
-                formatted_lines.append(f"│ {line.ljust(57)}│")
-            else:
-                formatted_lines.append(f"│{''.ljust(58)}│")
-                
-        # Montar resposta final
-        formatted_answer = f"{border_top}\n" + "\n".join(formatted_lines) + f"\n{border_bottom}"
+        return _build_dataframe_answer(question, output, generated_code)
+
+    except Exception as e:
+        raise _llm_error_to_http(e)
+
+async def aquery_dataframe(df: pd.DataFrame, question: str, query_engine=None,
+                           data_context: Dict[str, Any] = None):
+    """
+    Versão assíncrona de query_dataframe.
+
+    A chamada ao LLM usa o cliente assíncrono e não bloqueia o event loop;
+    o trabalho de CPU (perfil dos dados, execução da instrução Pandas e
+    formatação) roda nos pools de app.executor.
+    """
+    from app.executor import run_blocking, run_pandas
+
+    if df is None or df.empty:
+        raise HTTPException(status_code=400, detail="Nenhum dado carregado para consulta.")
+
+    try:
+        if data_context is None:
+            data_context = await run_blocking(build_data_context, df)
+        _log_data_context(df, data_context)
+
+        if query_engine is None:
+            query_engine = create_pandas_query_engine(df, data_context)
         
-        # Log da resposta formatada
-        logger.info("=== RESPOSTA FORMATADA ===")
-        logger.info("\n" + formatted_answer)
-
-        # Log da resposta
-        logger.info(f"Pergunta processada: {question}")
-        logger.info(f"Código gerado: {generated_code}")
-        logger.info(f"SQL equivalente: {sql_equivalent}")
+        response = await query_engine.aquery(question)
+        generated_code = _extract_generated_code(response)
+        output = await run_pandas(df, generated_code) if generated_code else response.response
         
-        return formatted_answer, generated_code, sql_equivalent
+        return await run_blocking(_build_dataframe_answer, question, output, generated_code)
 
     except Exception as e:
-        logger.error(f"Erro ao processar consulta: {e}")
-        error_msg = str(e)
-        if "AuthenticationError" in error_msg:
-            error_msg = "Erro de autenticação com a API OpenAI. Verifique sua chave."
-        elif "RateLimitError" in error_msg:
-            error_msg = "Limite de taxa da API OpenAI atingido. Tente novamente mais tarde."
-        elif "invalid_request_error" in error_msg:
-            error_msg = "Erro na requisição à API. Verifique as configurações do modelo."
-        
-        raise HTTPException(status_code=500, detail=error_msg)
+        raise _llm_error_to_http(e)
+
+async def astream_dataframe_query(df: pd.DataFrame, question: str, query_engine=None,
+                                  data_context: Dict[str, Any] = None) -> AsyncIterator[Tuple[str, Dict[str, Any]]]:
+    """
+    Versão em streaming de aquery_dataframe.
+
+    Gera eventos (nome, dados) à medida que ficam prontos: "token" para cada
+    trecho da instrução Pandas produzido pelo LLM, "code" com a instrução
+    completa e "result" com a resposta executada e formatada.
+    """
+    from app.executor import run_blocking, run_pandas
+    from llama_index.experimental.query_engine.pandas.pandas_query_engine import DEFAULT_INSTRUCTION_STR
+
+    if df is None or df.empty:
+        raise HTTPException(status_code=400, detail="Nenhum dado carregado para consulta.")
 
+    try:
+        if data_context is None:
+            data_context = await run_blocking(build_data_context, df)
+        _log_data_context(df, data_context)
+
+        if query_engine is None:
+            query_engine = create_pandas_query_engine(df, data_context)
+
+        # Mesmo prompt que o PandasQueryEngine usa em aquery, mas com o LLM em streaming
+        pandas_prompt = query_engine.get_prompts()["pandas_prompt"]
+        tokens = []
+        stream = await get_enhanced_llm().astream(
+            pandas_prompt,
+            df_str=_table_context(df),
+            query_str=question,
+            instruction_str=DEFAULT_INSTRUCTION_STR,
+        )
+        async for delta in stream:
+            tokens.append(delta)
+            yield "token", {"delta": delta}
+
+        generated_code = "".join(tokens)
+        yield "code", {
+            "generated_code": generated_code,
+            "sql_equivalent": generate_sql_equivalent(generated_code)
+        }
+
+        output = await run_pandas(df, generated_code)
+        answer, generated_code, sql_equivalent = await run_blocking(_build_dataframe_answer, question, output, generated_code)
+        yield "result", {"answer": answer, "generated_code": generated_code, "sql_equivalent": sql_equivalent}
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise _llm_error_to_http(e)
@@ -0,0 +1,159 @@
+# backend/app/schema_catalog.py
+
+import os
+import threading
+import logging
+from typing import Dict, Any, List, Optional
+
+from sqlalchemy import MetaData, text
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import SQLAlchemyError
+from fastapi import HTTPException
+
+# Configurar logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+def get_schema_version(engine: Engine) -> Optional[str]:
+    """
+    Versão atual do schema do banco: PRAGMA schema_version no SQLite (incrementada
+    a cada CREATE/ALTER/DROP); para outros dialetos, a data de modificação do
+    arquivo quando houver. None se não for possível detectar mudanças.
+    """
+    if engine.dialect.name == "sqlite":
+        with engine.connect() as connection:
+            return f"sqlite:{connection.execute(text('PRAGMA schema_version')).scalar()}"
+    database = engine.url.database
+    if database and os.path.isfile(database):
+        return f"mtime:{os.stat(database).st_mtime_ns}"
+    return None
+
+class SchemaCatalog:
+    """
+    Catálogo de schemas por banco (URL da engine).
+
+    A reflexão (tabelas, colunas e índices) é feita uma vez e reaproveitada por
+    todas as sessões e consultas de metadados; a entrada é refeita quando a
+    versão do schema muda.
+    """
+
+    def __init__(self):
+        self._entries: Dict[str, Dict[str, Any]] = {}
+        self._build_locks: Dict[str, threading.Lock] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.builds = 0
+
+    def _reflect(self, engine: Engine, version: Optional[str]) -> Dict[str, Any]:
+        metadata = MetaData()
+        metadata.reflect(bind=engine)
+        columns = {}
+        indexes = {}
+        for name, table in metadata.tables.items():
+            columns[name] = [
+                {
+                    "name": col.name,
+                    "type": str(col.type),
+                    "nullable": col.nullable,
+                    "default": str(col.server_default.arg) if col.server_default is not None else None
+                }
+                for col in table.columns
+            ]
+            indexes[name] = [
+                {
+                    "name": idx.name,
+                    "columns": [col.name for col in idx.columns],
+                    "unique": bool(idx.unique)
+                }
+                for idx in table.indexes
+            ]
+        return {
+            "version": version,
+            "tables": sorted(metadata.tables),
+            "columns": columns,
+            "indexes": indexes,
+            "metadata": metadata
+        }
+
+    def get(self, engine: Engine) -> Dict[str, Any]:
+        """Retorna o catálogo do banco, refletindo o schema apenas se ele mudou."""
+        key = engine.url.render_as_string(hide_password=True)
+        try:
+            version = get_schema_version(engine)
+            with self._lock:
+                entry = self._entries.get(key)
+                if entry is not None and version is not None and entry["version"] == version:
+                    self.hits += 1
+                    return entry
+                build_lock = self._build_locks.setdefault(key, threading.Lock())
+
+            with build_lock:
+                with self._lock:
+                    entry = self._entries.get(key)
+                    if entry is not None and version is not None and entry["version"] == version:
+                        self.hits += 1
+                        return entry
+                logger.info(f"Refletindo schema de {key} (versão {version})")
+                entry = self._reflect(engine, version)
+                with self._lock:
+                    self._entries[key] = entry
+                    self.builds += 1
+                return entry
+        except SQLAlchemyError as e:
+            logger.error(f"Erro ao refletir o schema de {key}: {e}")
+            raise HTTPException(status_code=500, detail=f"Erro ao ler metadados do banco de dados: {e}")
+
+    def get_table(self, engine: Engine, table_name: str) -> Dict[str, Any]:
+        """Colunas e índices de uma tabela (404 se ela não existir)."""
+        entry = self.get(engine)
+        if table_name not in entry["columns"]:
+            raise HTTPException(status_code=404, detail=f"Tabela '{table_name}' não encontrada")
+        return {
+            "table_name": table_name,
+            "columns": entry["columns"][table_name],
+            "indexes": entry["indexes"][table_name]
+        }
+
+    def copy_metadata(self, engine: Engine) -> MetaData:
+        """
+        Cópia independente da MetaData do catálogo, para quem precisa alterá-la
+        (ex.: SQLDatabase chama reflect() na MetaData recebida). A MetaData do
+        catálogo é compartilhada entre threads e não deve ser modificada.
+        """
+        copy = MetaData()
+        for table in self.get(engine)["metadata"].sorted_tables:
+            table.to_metadata(copy)
+        return copy
+
+    def invalidate(self, engine: Optional[Engine] = None):
+        with self._lock:
+            if engine is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(engine.url.render_as_string(hide_password=True), None)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "databases": [
+                {"url": url, "version": entry["version"], "tables": len(entry["tables"])}
+                for url, entry in list(self._entries.items())
+            ],
+            "hits": self.hits,
+            "builds": self.builds
+        }
+
+# Instância global do catálogo de schemas
+schema_catalog = SchemaCatalog()
+
+def get_schema_catalog() -> SchemaCatalog:
+    """Dependency para obter o catálogo de schemas"""
+    return schema_catalog
+
+def describe_tables(engine: Engine, tables: Optional[List[str]] = None) -> Dict[str, List[Dict[str, Any]]]:
+    """Colunas (nome e tipo) das tabelas informadas, ou de todas, a partir do catálogo."""
+    entry = schema_catalog.get(engine)
+    selected = tables if tables else entry["tables"]
+    return {
+        table: [{"name": col["name"], "type": col["type"]} for col in entry["columns"][table]]
+        for table in selected if table in entry["columns"]
+    }
@@ -9,6 +9,8 @@ from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from sqlalchemy import text
 import re
 
+from app.sql_validator import sql_validator, SQLPolicy, WRITE_KEYWORDS
+
 # Configuração de segurança
 security = HTTPBearer()
 
@@ -16,8 +18,13 @@ class SecurityManager:
     def __init__(self):
         self.api_key = os.getenv("API_SECRET_KEY", "default-secret-key")
         self.max_file_size = 50 * 1024 * 1024  # 50MB
-        self.allowed_file_types = {'.csv', '.xlsx', '.xls', '.json', '.parquet'}
+        self.allowed_file_types = {'.csv', '.xlsx', '.xls', '.json', '.parquet', '.arrow', '.feather', '.ipc'}
         self.max_query_length = 1000
+        # Além de escrita/DDL, bloqueia UNION e SCRIPT (injeção em consultas montadas)
+        self.sql_policy = SQLPolicy(
+            name="sanitize",
+            blocked_keywords=WRITE_KEYWORDS | {'UNION', 'SCRIPT'}
+        )
         
     def validate_file_upload(self, filename: str, file_size: int) -> bool:
         """Valida upload de arquivo"""
@@ -56,21 +63,14 @@ class SecurityManager:
     
     def sanitize_sql_query(self, query: str) -> str:
         """Sanitiza consultas SQL para prevenir SQL injection"""
-        # Lista de palavras-chave perigosas
-        dangerous_keywords = [
-            'DROP', 'DELETE', 'INSERT', 'UPDATE', 'ALTER', 'CREATE',
-            'TRUNCATE', 'EXEC', 'EXECUTE', 'UNION', 'SCRIPT'
-        ]
-        
-        query_upper = query.upper()
-        for keyword in dangerous_keywords:
-            if keyword in query_upper:
-                raise HTTPException(
-                    status_code=400,
-                    detail=f"Operação SQL não permitida: {keyword}"
-                )
+        verdict = sql_validator.validate(query, self.sql_policy)
+        if not verdict.is_valid:
+            raise HTTPException(
+                status_code=400,
+                detail=verdict.error
+            )
         
-        return query
+        return verdict.normalized
     
     def validate_question(self, question: str) -> bool:
         """Valida pergunta do usuário"""
@@ -0,0 +1,530 @@
+# backend/app/session_store.py
+
+import os
+import json
+import time
+import sqlite3
+import tempfile
+import threading
+import logging
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Dict, Any, Optional, List, Callable
+
+import pandas as pd
+
+# Configurar logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+DEFAULT_MEMORY_BUDGET_MB = 1024
+DEFAULT_SESSION_TTL_SECONDS = 3600
+DEFAULT_SPILL_DIR = os.path.join(tempfile.gettempdir(), "data_analysis_sessions")
+DEFAULT_SHARED_DIR = os.path.join(tempfile.gettempdir(), "data_analysis_shared_sessions")
+
+def estimate_session_size(session: Dict[str, Any]) -> int:
+    """Estima o uso de memória de uma sessão (DataFrame medido com deep=True)."""
+    df = session.get("dataframe")
+    if isinstance(df, pd.DataFrame):
+        return int(df.memory_usage(deep=True).sum())
+    return 0
+
+class SessionStore:
+    """
+    Armazena sessões em memória com despejo LRU por orçamento de memória
+    e expiração por TTL individual.
+
+    Sessões de DataFrame despejadas por falta de memória são gravadas em disco
+    (Arrow IPC + metadados JSON) e recarregadas de forma transparente no próximo
+    acesso. O diretório é reindexado na inicialização, então sessões frias
+    sobrevivem a reinícios do processo.
+    """
+
+    def __init__(self,
+                 memory_budget_bytes: Optional[int] = None,
+                 default_ttl_seconds: Optional[int] = None,
+                 spill_dir: Optional[str] = None):
+        if memory_budget_bytes is None:
+            memory_budget_bytes = int(os.getenv("SESSION_MEMORY_BUDGET_MB", DEFAULT_MEMORY_BUDGET_MB)) * 1024 * 1024
+        if default_ttl_seconds is None:
+            default_ttl_seconds = int(os.getenv("SESSION_TTL_SECONDS", DEFAULT_SESSION_TTL_SECONDS))
+        if spill_dir is None:
+            spill_dir = os.getenv("SESSION_SPILL_DIR", DEFAULT_SPILL_DIR)
+        self.memory_budget_bytes = memory_budget_bytes
+        self.default_ttl_seconds = default_ttl_seconds
+        # Diretório vazio desativa o despejo para disco
+        self.spill_dir = spill_dir or None
+        # session_id -> {"data", "size_bytes", "ttl", "last_access", "created_at"}
+        self._entries: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        # session_id -> {"size_bytes", "disk_bytes", "ttl", "last_access"} das sessões em disco
+        self._spilled: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.RLock()
+        self.used_bytes = 0
+        self.evictions = {"lru": 0, "ttl": 0, "spilled": 0, "rehydrated": 0}
+        self.recent_evictions: List[Dict[str, Any]] = []
+        if self.spill_dir:
+            os.makedirs(self.spill_dir, exist_ok=True)
+            self._reindex_spill_dir()
+
+    def put(self, session_id: str, session: Dict[str, Any], ttl_seconds: Optional[int] = None):
+        """Adiciona ou substitui uma sessão e aplica os limites do store."""
+        size = estimate_session_size(session)
+        now = time.time()
+        with self._lock:
+            if session_id in self._entries:
+                self._remove(session_id)
+            if self._spilled.pop(session_id, None) is not None:
+                self._delete_spill_files(session_id)
+            self._entries[session_id] = {
+                "data": session,
+                "size_bytes": size,
+                "ttl": ttl_seconds if ttl_seconds is not None else self.default_ttl_seconds,
+                "last_access": now,
+                "created_at": now
+            }
+            self.used_bytes += size
+            self._evict_expired(now)
+            self._enforce_budget(keep=session_id)
+
+    def get(self, session_id: str) -> Optional[Dict[str, Any]]:
+        """Retorna a sessão (marcando-a como recente) ou None se ausente/expirada."""
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(session_id)
+            if entry is None:
+                if session_id in self._spilled:
+                    return self._rehydrate(session_id, now)
+                return None
+            if self._is_expired(entry, now):
+                self._evict(session_id, "ttl")
+                return None
+            entry["last_access"] = now
+            self._entries.move_to_end(session_id)
+            return entry["data"]
+
+    def append_history(self, session_id: str, item: Dict[str, Any]) -> bool:
+        """Adiciona uma interação ao histórico da sessão."""
+        session = self.get(session_id)
+        if session is None:
+            return False
+        session["history"].append(item)
+        return True
+
+    def __contains__(self, session_id: str) -> bool:
+        with self._lock:
+            return session_id in self._entries or session_id in self._spilled
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _is_expired(self, entry: Dict[str, Any], now: float) -> bool:
+        return entry["ttl"] is not None and entry["ttl"] > 0 and now - entry["last_access"] > entry["ttl"]
+
+    def _remove(self, session_id: str) -> Dict[str, Any]:
+        entry = self._entries.pop(session_id)
+        self.used_bytes -= entry["size_bytes"]
+        return entry
+
+    def _evict(self, session_id: str, reason: str):
+        entry = self._remove(session_id)
+        if reason == "lru" and self._spill(session_id, entry):
+            reason = "spilled"
+        elif reason == "ttl":
+            self._delete_spill_files(session_id)
+        # Conta só o motivo registrado: sessão gravada em disco não conta também como "lru"
+        self.evictions[reason] += 1
+        self.recent_evictions.append({
+            "session_id": session_id,
+            "reason": reason,
+            "size_bytes": entry["size_bytes"],
+            "timestamp": time.time()
+        })
+        # Manter apenas os últimos 100 despejos
+        if len(self.recent_evictions) > 100:
+            self.recent_evictions = self.recent_evictions[-100:]
+        logger.info(f"Sessão {session_id} removida ({reason}, {entry['size_bytes']} bytes)")
+
+    def _evict_expired(self, now: float):
+        expired = [sid for sid, entry in self._entries.items() if self._is_expired(entry, now)]
+        for session_id in expired:
+            self._evict(session_id, "ttl")
+        expired_on_disk = [sid for sid, meta in self._spilled.items() if self._is_expired(meta, now)]
+        for session_id in expired_on_disk:
+            self._spilled.pop(session_id)
+            self._delete_spill_files(session_id)
+            self.evictions["ttl"] += 1
+
+    # --- Camada em disco ---
+
+    def _spill_paths(self, session_id: str):
+        return (os.path.join(self.spill_dir, f"{session_id}.arrow"),
+                os.path.join(self.spill_dir, f"{session_id}.json"))
+
+    def _spill(self, session_id: str, entry: Dict[str, Any]) -> bool:
+        """Grava uma sessão de DataFrame em disco. Retorna False se não foi possível."""
+        session = entry["data"]
+        if not self.spill_dir or session.get("type") != "dataframe":
+            return False
+        data_path, meta_path = self._spill_paths(session_id)
+        try:
+            # Se a sessão veio do disco e o DataFrame não mudou, basta atualizar os metadados
+            if not entry.get("spill_synced") or not os.path.exists(data_path):
+                import pyarrow as pa
+                import pyarrow.feather as feather
+                table = pa.Table.from_pandas(session["dataframe"], preserve_index=False)
+                tmp_path = data_path + ".tmp"
+                # Sem compressão para permitir leitura mapeada em memória
+                feather.write_feather(table, tmp_path, compression="uncompressed")
+                os.replace(tmp_path, data_path)
+            meta = {
+                "type": session.get("type"),
+                "filename": session.get("filename"),
+                "history": session.get("history", []),
+                "size_bytes": entry["size_bytes"],
+                "ttl": entry["ttl"],
+                "last_access": entry["last_access"],
+                "created_at": entry["created_at"]
+            }
+            tmp_path = meta_path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(meta, f, ensure_ascii=False, default=str)
+            os.replace(tmp_path, meta_path)
+        except Exception as e:
+            logger.warning(f"Não foi possível gravar a sessão {session_id} em disco: {e}")
+            self._delete_spill_files(session_id)
+            return False
+        self._spilled[session_id] = {
+            "size_bytes": entry["size_bytes"],
+            "disk_bytes": os.path.getsize(data_path),
+            "ttl": entry["ttl"],
+            "last_access": entry["last_access"]
+        }
+        return True
+
+    def _rehydrate(self, session_id: str, now: float) -> Optional[Dict[str, Any]]:
+        """Recarrega uma sessão do disco para a memória."""
+        spilled = self._spilled.pop(session_id)
+        if self._is_expired(spilled, now):
+            self._delete_spill_files(session_id)
+            self.evictions["ttl"] += 1
+            return None
+        data_path, meta_path = self._spill_paths(session_id)
+        try:
+            import pyarrow.feather as feather
+            with open(meta_path, encoding="utf-8") as f:
+                meta = json.load(f)
+            # Colunas somente leitura (mapeadas do arquivo): run_pandas_instruction
+            # copia o DataFrame antes de executar instruções sobre ele
+            df = feather.read_table(data_path, memory_map=True).to_pandas(split_blocks=True)
+        except Exception as e:
+            logger.error(f"Falha ao recarregar a sessão {session_id} do disco: {e}")
+            self._delete_spill_files(session_id)
+            return None
+        session = {
+            "type": "dataframe",
+            "dataframe": df,
+            "filename": meta.get("filename"),
+            "history": meta.get("history", []),
+            "query_engine": None
+        }
+        self.put(session_id, session, ttl_seconds=meta.get("ttl"))
+        self._entries[session_id]["created_at"] = meta.get("created_at", now)
+        # A cópia em disco continua válida enquanto o DataFrame não mudar
+        self._entries[session_id]["spill_synced"] = True
+        self.evictions["rehydrated"] += 1
+        logger.info(f"Sessão {session_id} recarregada do disco")
+        return session
+
+    def _delete_spill_files(self, session_id: str):
+        if not self.spill_dir:
+            return
+        for path in self._spill_paths(session_id):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def _reindex_spill_dir(self):
+        """Registra as sessões já gravadas em disco (ex.: após reinício do processo)."""
+        for name in os.listdir(self.spill_dir):
+            if not name.endswith(".json"):
+                continue
+            session_id = name[:-len(".json")]
+            data_path, meta_path = self._spill_paths(session_id)
+            try:
+                with open(meta_path, encoding="utf-8") as f:
+                    meta = json.load(f)
+                self._spilled[session_id] = {
+                    "size_bytes": meta.get("size_bytes", 0),
+                    "disk_bytes": os.path.getsize(data_path),
+                    "ttl": meta.get("ttl"),
+                    "last_access": meta.get("last_access", time.time())
+                }
+            except (OSError, ValueError) as e:
+                logger.warning(f"Ignorando sessão em disco inválida {session_id}: {e}")
+        if self._spilled:
+            logger.info(f"{len(self._spilled)} sessões encontradas em {self.spill_dir}")
+
+    def _enforce_budget(self, keep: Optional[str] = None):
+        """Remove as sessões menos usadas até caber no orçamento."""
+        while self.used_bytes > self.memory_budget_bytes:
+            victim = next((sid for sid in self._entries if sid != keep), None)
+            if victim is None:
+                logger.warning(
+                    f"Sessão {keep} sozinha excede o orçamento de memória "
+                    f"({self.used_bytes} > {self.memory_budget_bytes} bytes)"
+                )
+                break
+            self._evict(victim, "lru")
+
+    def stats(self) -> Dict[str, Any]:
+        """Resumo do uso de memória e dos despejos, para o endpoint administrativo."""
+        now = time.time()
+        with self._lock:
+            self._evict_expired(now)
+            sessions = [
+                {
+                    "session_id": sid,
+                    "type": entry["data"].get("type"),
+                    "size_bytes": entry["size_bytes"],
+                    "idle_seconds": round(now - entry["last_access"], 1),
+                    "ttl_seconds": entry["ttl"]
+                }
+                for sid, entry in reversed(self._entries.items())
+            ]
+            return {
+                "session_count": len(self._entries),
+                "used_bytes": self.used_bytes,
+                "memory_budget_bytes": self.memory_budget_bytes,
+                "default_ttl_seconds": self.default_ttl_seconds,
+                "spill_dir": self.spill_dir,
+                "spilled_session_count": len(self._spilled),
+                "spilled_disk_bytes": sum(meta["disk_bytes"] for meta in self._spilled.values()),
+                "evictions": dict(self.evictions),
+                "recent_evictions": list(self.recent_evictions),
+                "sessions": sessions
+            }
+
+class SQLiteSessionBackend:
+    """
+    Backend de sessões compartilhado entre workers.
+
+    Metadados e histórico ficam em um banco SQLite e os DataFrames em arquivos
+    Arrow IPC no mesmo diretório, então qualquer worker (uvicorn --workers N)
+    atende qualquer sessão. Cada processo mantém um cache local (SessionStore,
+    sem despejo para disco) com os DataFrames e engines já carregados.
+    """
+
+    def __init__(self,
+                 shared_dir: Optional[str] = None,
+                 engine_factory: Optional[Callable[[str], Any]] = None,
+                 default_ttl_seconds: Optional[int] = None):
+        if shared_dir is None:
+            shared_dir = os.getenv("SESSION_SHARED_DIR", DEFAULT_SHARED_DIR)
+        if default_ttl_seconds is None:
+            default_ttl_seconds = int(os.getenv("SESSION_TTL_SECONDS", DEFAULT_SESSION_TTL_SECONDS))
+        self.shared_dir = shared_dir
+        self.db_path = os.path.join(shared_dir, "sessions.db")
+        self.default_ttl_seconds = default_ttl_seconds
+        # Recria a engine SQLAlchemy de sessões de banco de dados neste processo
+        self.engine_factory = engine_factory
+        self.local = SessionStore(default_ttl_seconds=default_ttl_seconds, spill_dir="")
+        os.makedirs(shared_dir, exist_ok=True)
+        self._init_db()
+
+    @contextmanager
+    def _connect(self):
+        """Abre uma conexão curta; confirma a transação e fecha ao final."""
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        conn.row_factory = sqlite3.Row
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def _init_db(self):
+        with self._connect() as conn:
+            # WAL permite leituras concorrentes de vários workers
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS sessions (
+                    session_id TEXT PRIMARY KEY,
+                    type TEXT NOT NULL,
+                    filename TEXT,
+                    db_path TEXT,
+                    tables TEXT,
+                    ttl INTEGER,
+                    created_at REAL NOT NULL,
+                    last_access REAL NOT NULL
+                )
+            """)
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS history (
+                    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                    id TEXT NOT NULL,
+                    session_id TEXT NOT NULL,
+                    question TEXT,
+                    answer TEXT,
+                    code TEXT
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_history_session ON history(session_id)")
+
+    def _data_path(self, session_id: str) -> str:
+        return os.path.join(self.shared_dir, f"{session_id}.arrow")
+
+    def _is_expired(self, row: sqlite3.Row, now: float) -> bool:
+        return row["ttl"] is not None and row["ttl"] > 0 and now - row["last_access"] > row["ttl"]
+
+    def put(self, session_id: str, session: Dict[str, Any], ttl_seconds: Optional[int] = None):
+        """Grava a sessão no armazenamento compartilhado e no cache local."""
+        now = time.time()
+        ttl = ttl_seconds if ttl_seconds is not None else self.default_ttl_seconds
+        if session.get("type") == "dataframe":
+            self._write_dataframe(session_id, session["dataframe"])
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO sessions VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (session_id, session.get("type"), session.get("filename"), session.get("db_path"),
+                 json.dumps(session.get("tables")), ttl, now, now)
+            )
+            conn.execute("DELETE FROM history WHERE session_id = ?", (session_id,))
+            conn.executemany(
+                "INSERT INTO history (id, session_id, question, answer, code) VALUES (?, ?, ?, ?, ?)",
+                [(h["id"], session_id, h.get("question"), h.get("answer"), h.get("code"))
+                 for h in session.get("history", [])]
+            )
+        self.local.put(session_id, session, ttl_seconds=ttl)
+        self._delete_expired(now)
+
+    def get(self, session_id: str) -> Optional[Dict[str, Any]]:
+        """Retorna a sessão, carregando-a do armazenamento compartilhado se necessário."""
+        now = time.time()
+        with self._connect() as conn:
+            row = conn.execute("SELECT * FROM sessions WHERE session_id = ?", (session_id,)).fetchone()
+            if row is None:
+                return None
+            if self._is_expired(row, now):
+                self._delete(conn, session_id)
+                return None
+            conn.execute("UPDATE sessions SET last_access = ? WHERE session_id = ?", (now, session_id))
+            history = [
+                {"id": h["id"], "question": h["question"], "answer": h["answer"], "code": h["code"]}
+                for h in conn.execute(
+                    "SELECT id, question, answer, code FROM history WHERE session_id = ? ORDER BY seq",
+                    (session_id,)
+                )
+            ]
+
+        session = self.local.get(session_id)
+        if session is None:
+            session = self._load(row)
+            if session is None:
+                return None
+            self.local.put(session_id, session, ttl_seconds=row["ttl"])
+        # Outro worker pode ter adicionado interações
+        session["history"] = history
+        return session
+
+    def append_history(self, session_id: str, item: Dict[str, Any]) -> bool:
+        """Adiciona uma interação ao histórico compartilhado."""
+        with self._connect() as conn:
+            cursor = conn.execute(
+                "INSERT INTO history (id, session_id, question, answer, code) "
+                "SELECT ?, session_id, ?, ?, ? FROM sessions WHERE session_id = ?",
+                (item["id"], item.get("question"), item.get("answer"), item.get("code"), session_id)
+            )
+            if cursor.rowcount == 0:
+                return False
+        session = self.local.get(session_id)
+        if session is not None:
+            session["history"].append(item)
+        return True
+
+    def __contains__(self, session_id: str) -> bool:
+        with self._connect() as conn:
+            return conn.execute("SELECT 1 FROM sessions WHERE session_id = ?", (session_id,)).fetchone() is not None
+
+    def _write_dataframe(self, session_id: str, df: pd.DataFrame):
+        import pyarrow as pa
+        import pyarrow.feather as feather
+        data_path = self._data_path(session_id)
+        tmp_path = f"{data_path}.{os.getpid()}.tmp"
+        feather.write_feather(pa.Table.from_pandas(df, preserve_index=False), tmp_path, compression="uncompressed")
+        os.replace(tmp_path, data_path)
+
+    def _load(self, row: sqlite3.Row) -> Optional[Dict[str, Any]]:
+        """Reconstrói uma sessão neste processo a partir dos dados compartilhados."""
+        session_id = row["session_id"]
+        try:
+            if row["type"] == "dataframe":
+                import pyarrow.feather as feather
+                df = feather.read_table(self._data_path(session_id), memory_map=True).to_pandas(split_blocks=True)
+                return {
+                    "type": "dataframe",
+                    "dataframe": df,
+                    "filename": row["filename"],
+                    "history": [],
+                    "query_engine": None
+                }
+            if row["type"] == "database":
+                if self.engine_factory is None:
+                    raise RuntimeError("Nenhuma fábrica de engine configurada")
+                return {
+                    "type": "database",
+                    "db_path": row["db_path"],
+                    "tables": json.loads(row["tables"] or "[]"),
+                    "engine_instance": self.engine_factory(row["db_path"]),
+                    "query_engine": None,
+                    "history": []
+                }
+        except Exception as e:
+            logger.error(f"Falha ao carregar a sessão compartilhada {session_id}: {e}")
+        return None
+
+    def _delete(self, conn: sqlite3.Connection, session_id: str):
+        conn.execute("DELETE FROM sessions WHERE session_id = ?", (session_id,))
+        conn.execute("DELETE FROM history WHERE session_id = ?", (session_id,))
+        try:
+            os.remove(self._data_path(session_id))
+        except FileNotFoundError:
+            pass
+        logger.info(f"Sessão compartilhada {session_id} expirada")
+
+    def _delete_expired(self, now: float):
+        with self._connect() as conn:
+            expired = conn.execute(
+                "SELECT session_id FROM sessions WHERE ttl > 0 AND ? - last_access > ttl", (now,)
+            ).fetchall()
+            for row in expired:
+                self._delete(conn, row["session_id"])
+
+    def stats(self) -> Dict[str, Any]:
+        """Resumo do armazenamento compartilhado e do cache local deste worker."""
+        self._delete_expired(time.time())
+        with self._connect() as conn:
+            counts = {row["type"]: row["n"] for row in conn.execute(
+                "SELECT type, COUNT(*) AS n FROM sessions GROUP BY type"
+            )}
+        disk_bytes = sum(
+            entry.stat().st_size for entry in os.scandir(self.shared_dir) if entry.name.endswith(".arrow")
+        )
+        return {
+            "backend": "sqlite",
+            "shared_dir": self.shared_dir,
+            "shared_session_count": sum(counts.values()),
+            "shared_sessions_by_type": counts,
+            "shared_disk_bytes": disk_bytes,
+            "worker_pid": os.getpid(),
+            "local_cache": self.local.stats()
+        }
+
+def create_session_store(engine_factory: Optional[Callable[[str], Any]] = None):
+    """Cria o backend de sessões configurado em SESSION_BACKEND ('memory' ou 'sqlite')."""
+    backend = os.getenv("SESSION_BACKEND", "memory").lower()
+    if backend == "sqlite":
+        return SQLiteSessionBackend(engine_factory=engine_factory)
+    if backend != "memory":
+        logger.warning(f"SESSION_BACKEND desconhecido '{backend}', usando 'memory'")
+    return SessionStore()
@@ -0,0 +1,220 @@
+# backend/app/sql_validator.py
+
+import os
+import re
+import hashlib
+import threading
+import logging
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, Any, FrozenSet, List, Optional, Tuple
+
+# Configurar logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+SQL_VALIDATION_CACHE_SIZE = int(os.getenv("SQL_VALIDATION_CACHE_SIZE", 2048))
+
+# Tokens da consulta, na ordem de tentativa. Literais, identificadores entre
+# aspas e comentários são tokens inteiros: palavras dentro deles nunca contam
+# como palavras-chave. Um "/*" sem "*/" não pode cair no grupo de operadores:
+# o resto da consulta (e um LIMIT acrescentado depois) ficaria comentado.
+_TOKEN_PATTERN = re.compile(r"""
+    (?P<space>\s+)
+  | (?P<comment>--[^\n]*|/\*.*?\*/)
+  | (?P<unclosed>/\*)
+  | (?P<string>'(?:[^']|'')*')
+  | (?P<quoted>"(?:[^"]|"")*"|`(?:[^`]|``)*`|\[[^\]]*\])
+  | (?P<number>(?:\d+(?:\.\d*)?|\.\d+)(?:[eE][+-]?\d+)?|0[xX][0-9a-fA-F]+)
+  | (?P<word>[^\W\d]\w*)
+  | (?P<param>[?:@$]\w*)
+  | (?P<operator><>|<=|>=|!=|==|\|\||<<|>>|->>|->|[-+*/%<>=~&|,.;()])
+""", re.VERBOSE | re.DOTALL)
+
+@dataclass(frozen=True)
+class SQLPolicy:
+    """Regras aplicadas a uma instrução: palavras-chave bloqueadas e tipos de instrução aceitos."""
+    name: str
+    blocked_keywords: FrozenSet[str]
+    # None aceita qualquer tipo de instrução sem palavras bloqueadas
+    allowed_statements: Optional[FrozenSet[str]] = None
+
+@dataclass(frozen=True)
+class SQLVerdict:
+    """Resultado da validação de uma instrução SQL."""
+    is_valid: bool
+    normalized: str
+    statement_type: Optional[str] = None
+    has_limit: bool = False
+    error: Optional[str] = None
+    keyword: Optional[str] = None
+    severity: Optional[str] = None
+
+# Escritas, DDL e comandos administrativos
+WRITE_KEYWORDS = frozenset({
+    "DROP", "DELETE", "INSERT", "UPDATE", "ALTER", "CREATE",
+    "TRUNCATE", "EXEC", "EXECUTE", "GRANT", "REVOKE"
+})
+
+# Consultas de leitura geradas ou enviadas ao banco: SELECT, inclusive com CTE
+# (WITH ... SELECT), em que o tipo considerado é o da instrução principal
+READ_ONLY_POLICY = SQLPolicy(
+    name="read_only",
+    blocked_keywords=WRITE_KEYWORDS,
+    allowed_statements=frozenset({"SELECT"})
+)
+
+class SQLSyntaxError(ValueError):
+    """Consulta que não pôde ser dividida em tokens (aspas ou comentário sem fechamento)."""
+
+def tokenize_sql(query: str) -> List[Tuple[str, str]]:
+    """Divide a consulta em tokens (tipo, texto), sem espaços; comentários viram separadores."""
+    tokens = []
+    position = 0
+    length = len(query)
+    while position < length:
+        match = _TOKEN_PATTERN.match(query, position)
+        if match is None:
+            raise SQLSyntaxError(f"Consulta SQL malformada próximo de: {query[position:position + 20]!r}")
+        kind = match.lastgroup
+        if kind == "unclosed":
+            raise SQLSyntaxError(f"Comentário sem fechamento próximo de: {query[position:position + 20]!r}")
+        if kind in ("space", "comment"):
+            if tokens and tokens[-1][0] != "space":
+                tokens.append(("space", " "))
+        else:
+            tokens.append((kind, match.group()))
+        position = match.end()
+    while tokens and tokens[-1][0] == "space":
+        tokens.pop()
+    return tokens
+
+class _ParsedStatement:
+    """Estrutura da instrução extraída dos tokens (independente da política)."""
+
+    __slots__ = ("normalized", "statement_type", "keywords", "has_limit", "statements")
+
+    def __init__(self, tokens: List[Tuple[str, str]]):
+        statements = 0
+        depth = 0
+        keywords = []
+        has_limit = False
+        statement_type = None
+        # Em WITH ..., a instrução principal é a primeira palavra no nível 0
+        # logo após o ")" que fecha uma CTE (e que não seja o AS após a lista de colunas)
+        main_statement = None
+        in_statement = False
+        previous = None
+        for kind, value in tokens:
+            if kind == "space":
+                continue
+            if kind == "operator" and value == ";":
+                in_statement = False
+            else:
+                if not in_statement:
+                    statements += 1
+                    in_statement = True
+                if kind == "operator" and value == "(":
+                    depth += 1
+                elif kind == "operator" and value == ")":
+                    depth -= 1
+                elif kind == "word" and previous != ".":
+                    # Depois de "." é nome qualificado (tabela.coluna), não palavra-chave
+                    keyword = value.upper()
+                    keywords.append(keyword)
+                    if statement_type is None:
+                        statement_type = keyword
+                    elif (statement_type == "WITH" and main_statement is None and depth == 0
+                          and previous == ")" and keyword != "AS"):
+                        main_statement = keyword
+                    if keyword == "LIMIT" and depth == 0:
+                        has_limit = True
+                elif statement_type is None:
+                    statement_type = ""
+            previous = value
+        # Ponto e vírgula final não faz parte da instrução normalizada
+        while tokens and (tokens[-1] == ("operator", ";") or tokens[-1][0] == "space"):
+            tokens = tokens[:-1]
+        self.normalized = "".join(value for _, value in tokens)
+        self.statement_type = main_statement if statement_type == "WITH" else statement_type or None
+        self.keywords = frozenset(keywords)
+        self.has_limit = has_limit
+        self.statements = statements
+
+class SQLValidator:
+    """
+    Validador de SQL baseado em tokens, compartilhado pela camada de segurança.
+
+    Cada instrução é dividida em tokens uma única vez; o veredito e a forma
+    normalizada ficam em cache (LRU) pelo hash da instrução e pela política,
+    de modo que consultas repetidas (ex.: SQL gerado e reaproveitado) não são
+    reanalisadas.
+    """
+
+    def __init__(self, max_entries: int = SQL_VALIDATION_CACHE_SIZE):
+        self.max_entries = max_entries
+        self._verdicts: "OrderedDict[Tuple[str, SQLPolicy], SQLVerdict]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _evaluate(self, query: str, policy: SQLPolicy) -> SQLVerdict:
+        try:
+            parsed = _ParsedStatement(tokenize_sql(query))
+        except SQLSyntaxError as e:
+            return SQLVerdict(is_valid=False, normalized=query, error=str(e), severity="medium")
+
+        def reject(error: str, severity: str, keyword: Optional[str] = None) -> SQLVerdict:
+            return SQLVerdict(is_valid=False, normalized=parsed.normalized, statement_type=parsed.statement_type,
+                              has_limit=parsed.has_limit, error=error, keyword=keyword, severity=severity)
+
+        if parsed.statements == 0:
+            return reject("Consulta SQL vazia", "medium")
+        if parsed.statements > 1:
+            return reject("Apenas uma instrução SQL por consulta é permitida", "high")
+        blocked = parsed.keywords & policy.blocked_keywords
+        if blocked:
+            keyword = sorted(blocked)[0]
+            return reject(f"Operação SQL não permitida: {keyword}", "high", keyword)
+        if policy.allowed_statements is not None and parsed.statement_type not in policy.allowed_statements:
+            return reject("Apenas consultas SELECT são permitidas", "medium")
+        return SQLVerdict(is_valid=True, normalized=parsed.normalized, statement_type=parsed.statement_type,
+                          has_limit=parsed.has_limit)
+
+    def validate(self, query: str, policy: SQLPolicy = READ_ONLY_POLICY) -> SQLVerdict:
+        """Veredito da instrução segundo a política (do cache quando já analisada)."""
+        key = (hashlib.sha256(query.strip().encode()).hexdigest(), policy)
+        with self._lock:
+            verdict = self._verdicts.get(key)
+            if verdict is not None:
+                self._verdicts.move_to_end(key)
+                self.hits += 1
+                return verdict
+            self.misses += 1
+        verdict = self._evaluate(query.strip(), policy)
+        if not verdict.is_valid:
+            logger.warning(f"Consulta SQL rejeitada ({policy.name}): {verdict.error}")
+        with self._lock:
+            self._verdicts[key] = verdict
+            if len(self._verdicts) > self.max_entries:
+                self._verdicts.popitem(last=False)
+        return verdict
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "entries": len(self._verdicts),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses
+        }
+
+    def clear(self):
+        with self._lock:
+            self._verdicts.clear()
+
+# Instância global do validador de SQL
+sql_validator = SQLValidator()
+
+def get_sql_validator() -> SQLValidator:
+    """Dependency para obter o validador de SQL"""
+    return sql_validator
@@ -0,0 +1,88 @@
+# backend/benchmarks/bench_keyword_matcher.py
+#
+# Custo por pergunta da análise de palavras-chave: varreduras por substring
+# (implementação anterior, uma por agente) contra o casador compilado de
+# app.keyword_matcher, e o custo de um agente que reaproveita o resultado
+# já calculado (cache de match_question).
+#
+# Uso (a partir de backend/):
+#   python -m benchmarks.bench_keyword_matcher
+
+import random
+import time
+
+from app.keyword_matcher import (
+    question_matcher, match_question, INTENT_KEYWORDS, COMPLEXITY_KEYWORDS,
+    CONTEXT_KEYWORDS, STRATEGY_KEYWORDS, OPERATION_KEYWORDS
+)
+
+def legacy_analysis(question: str) -> None:
+    """Varreduras anteriores de QueryAnalyzerAgent, EnhancedQueryEngine e ResultSynthesizerAgent."""
+    question_lower = question.lower()
+    # _analyze_query_intent
+    intents = [intent for intent, keywords in INTENT_KEYWORDS.items()
+               if [k for k in keywords if k in question_lower]]
+    # _determine_complexity
+    if not (len(intents) <= 1 and len(question_lower.split()) < 10):
+        any(word in question_lower for word in COMPLEXITY_KEYWORDS)
+    # _extract_context_indicators
+    {name: any(word in question_lower for word in keywords) for name, keywords in CONTEXT_KEYWORDS.items()}
+    # optimize_query_strategy
+    any(word in question.lower() for word in STRATEGY_KEYWORDS["complex"])
+    any(word in question.lower() for word in STRATEGY_KEYWORDS["simple"])
+    # _generate_natural_response
+    for keywords in OPERATION_KEYWORDS.values():
+        any(word in question.lower() for word in keywords)
+
+def compiled_analysis(question: str) -> None:
+    """Uma passada do casador; os agentes consultam o mesmo resultado."""
+    matches = question_matcher.match(question)
+    [intent for intent in INTENT_KEYWORDS if matches.has(f"intent:{intent}")]
+    matches.has("complexity")
+    {name: matches.has(f"context:{name}") for name in CONTEXT_KEYWORDS}
+    matches.has("strategy:complex")
+    matches.has("strategy:simple")
+    for name in OPERATION_KEYWORDS:
+        matches.has(f"operation:{name}")
+
+def cached_lookup(question: str) -> None:
+    """Agentes seguintes no pipeline: a pergunta já foi casada pelo primeiro."""
+    match_question(question)
+
+def make_questions(count: int, seed: int = 0) -> list:
+    """Perguntas sintéticas misturando o vocabulário com palavras comuns."""
+    rng = random.Random(seed)
+    vocabulary = [k for keywords in INTENT_KEYWORDS.values() for k in keywords] + COMPLEXITY_KEYWORDS
+    filler = ["qual", "o", "a", "de", "por", "vendas", "clientes", "região", "produto", "últimos", "dias", "e"]
+    questions = []
+    for _ in range(count):
+        words = rng.choices(filler, k=rng.randint(6, 20)) + rng.choices(vocabulary, k=rng.randint(0, 3))
+        rng.shuffle(words)
+        questions.append(" ".join(words).capitalize() + "?")
+    return questions
+
+def run(fn, questions: list, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for question in questions:
+            fn(question)
+        best = min(best, time.perf_counter() - start)
+    return best / len(questions) * 1e6
+
+def main():
+    questions = make_questions(5_000)
+    legacy = run(legacy_analysis, questions, repeat=5)
+    compiled = run(compiled_analysis, questions, repeat=5)
+    # Cabe no cache de match_question
+    recent = questions[:match_question.cache_info().maxsize]
+    for question in recent:
+        match_question(question)
+    cached = run(cached_lookup, recent, repeat=5)
+    print(f"{'variante':<28}{'µs/pergunta':>12}{'ganho':>8}")
+    print(f"{'substring (anterior)':<28}{legacy:>12.1f}{1:>7.1f}x")
+    print(f"{'casador compilado':<28}{compiled:>12.1f}{legacy / compiled:>7.1f}x")
+    print(f"{'reaproveitado (cache)':<28}{cached:>12.2f}{legacy / cached:>7.1f}x")
+
+if __name__ == "__main__":
+    main()
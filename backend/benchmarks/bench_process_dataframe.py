@@ -0,0 +1,80 @@
+# backend/benchmarks/bench_process_dataframe.py
+#
+# Compara o process_dataframe atual com a versão anterior (loop por coluna)
+# em frames sintéticos largos e altos.
+#
+# Uso (a partir de backend/):
+#   python -m benchmarks.bench_process_dataframe
+
+import logging
+import time
+
+import numpy as np
+import pandas as pd
+
+from app.data_loader import process_dataframe, clean_column_name
+
+logging.getLogger("app.data_loader").setLevel(logging.ERROR)
+
+def legacy_process_dataframe(df: pd.DataFrame) -> pd.DataFrame:
+    """Implementação anterior, mantida aqui apenas para comparação."""
+    df = df.dropna(how='all')
+    df.columns = [clean_column_name(col) for col in df.columns]
+    for col in df.columns:
+        null_ratio = df[col].isnull().mean()
+        if null_ratio > 0.5:
+            logging.getLogger("app.data_loader").warning(f"Coluna {col} tem {null_ratio*100:.1f}% de valores nulos")
+        if df[col].dtype == 'object':
+            try:
+                numeric_conversion = pd.to_numeric(df[col], errors='coerce')
+                if numeric_conversion.notnull().sum() > df[col].notnull().sum() * 0.5:
+                    df[col] = numeric_conversion
+            except:
+                pass
+        if df[col].dtype in ['int64', 'float64']:
+            df[col] = df[col].fillna(0)
+        else:
+            df[col] = df[col].fillna("N/A")
+    return df
+
+def make_frame(rows: int, cols: int, seed: int = 0) -> pd.DataFrame:
+    """Gera um frame misto: numéricos com nulos, números como texto e categorias."""
+    rng = np.random.default_rng(seed)
+    data = {}
+    for i in range(cols):
+        kind = i % 3
+        if kind == 0:
+            values = rng.normal(size=rows)
+            values[rng.random(rows) < 0.1] = np.nan
+            data[f"Valor {i}"] = values
+        elif kind == 1:
+            values = rng.integers(0, 1000, size=rows).astype(str).astype(object)
+            values[rng.random(rows) < 0.1] = None
+            data[f"Número Texto {i}"] = values
+        else:
+            values = rng.choice(["norte", "sul", "leste", "oeste", None], size=rows)
+            data[f"Região {i}"] = values.astype(object)
+    return pd.DataFrame(data).astype({k: object for k, v in data.items() if v.dtype == object})
+
+def run(fn, df: pd.DataFrame, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        frame = df.copy()
+        start = time.perf_counter()
+        fn(frame)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+def main():
+    cases = {
+        "largo (2.000 x 300)": make_frame(2_000, 300),
+        "alto (500.000 x 6)": make_frame(500_000, 6),
+    }
+    print(f"{'caso':<22}{'anterior (s)':>14}{'atual (s)':>12}{'ganho':>8}")
+    for name, df in cases.items():
+        legacy = run(legacy_process_dataframe, df, repeat=3)
+        current = run(process_dataframe, df, repeat=3)
+        print(f"{name:<22}{legacy:>14.3f}{current:>12.3f}{legacy / current:>7.1f}x")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+# backend/tests/test_sql_validator.py
+
+import pytest
+
+from app.sql_validator import SQLValidator, SQLSyntaxError, tokenize_sql
+
+@pytest.fixture
+def validator():
+    return SQLValidator()
+
+@pytest.mark.parametrize("query", [
+    "SELECT created_at FROM t",
+    "SELECT update_ts, deleted FROM t",
+    "SELECT t.update FROM t",
+    "SELECT replace(name, 'a', 'b') FROM t",
+    "SELECT * FROM t WHERE name = 'DROP TABLE t'",
+    "SELECT 1 -- DELETE FROM t",
+    "WITH x AS (SELECT 1) SELECT * FROM x",
+    "WITH x(a) AS (SELECT 1), y AS (SELECT 2) SELECT * FROM x, y",
+])
+def test_accepts_read_only_queries(validator, query):
+    verdict = validator.validate(query)
+    assert verdict.is_valid, verdict.error
+    assert verdict.statement_type == "SELECT"
+
+@pytest.mark.parametrize("query, keyword", [
+    ("DELETE FROM t", "DELETE"),
+    ("SELECT * FROM t; DROP TABLE t", None),
+    ("SELECT 1; SELECT 2", None),
+    ("WITH x AS (SELECT 1) INSERT INTO t SELECT * FROM x", "INSERT"),
+])
+def test_rejects_writes_and_multiple_statements(validator, query, keyword):
+    verdict = validator.validate(query)
+    assert not verdict.is_valid
+    assert verdict.severity == "high"
+    assert verdict.keyword == keyword
+
+@pytest.mark.parametrize("query", [
+    "WITH x AS (SELECT 1) REPLACE INTO t SELECT * FROM x",
+    "WITH x AS (SELECT 1) VALUES (1)",
+    "PRAGMA table_info(t)",
+    "REPLACE INTO t VALUES (1)",
+])
+def test_rejects_non_select_statements(validator, query):
+    assert not validator.validate(query).is_valid
+
+def test_trailing_semicolon_is_not_a_second_statement(validator):
+    verdict = validator.validate("SELECT 1;")
+    assert verdict.is_valid
+    assert verdict.normalized == "SELECT 1"
+
+def test_limit_only_counts_at_top_level(validator):
+    assert validator.validate("SELECT * FROM t LIMIT 5").has_limit
+    assert not validator.validate("SELECT * FROM (SELECT * FROM t LIMIT 5)").has_limit
+    assert not validator.validate("SELECT * FROM t WHERE id IN (SELECT id FROM u LIMIT 1)").has_limit
+
+@pytest.mark.parametrize("query", [
+    "SELECT 'abc FROM t",
+    'SELECT "abc FROM t',
+    "SELECT value FROM t /*",
+    "SELECT value FROM t /* LIMIT 1",
+])
+def test_rejects_unterminated_quotes_and_comments(validator, query):
+    with pytest.raises(SQLSyntaxError):
+        tokenize_sql(query)
+    verdict = validator.validate(query)
+    assert not verdict.is_valid
+    assert not verdict.has_limit
+
+def test_verdicts_are_cached(validator):
+    validator.validate("SELECT 1")
+    validator.validate("  SELECT 1  ")
+    assert validator.stats()["hits"] == 1
+    assert validator.stats()["misses"] == 1
@@ -102,7 +102,8 @@ function App() {
     setCurrentCode(null);
     
     try {
-      const response = await fetch(`${API_URL}/query`, {
+      // Variante em streaming: o código gerado aparece enquanto o LLM responde
+      const response = await fetch(`${API_URL}/query/stream`, {
         method: 'POST',
         headers: {
           'Content-Type': 'application/json',
@@ -113,14 +114,43 @@ function App() {
         }),
       });
       
-      if (!response.ok) {
+      if (!response.ok || !response.body) {
         const errorData = await response.json();
         throw new Error(errorData.detail || 'Erro ao processar a consulta');
       }
       
-      const data = await response.json();
-      setCurrentAnswer(data.answer);
-      setCurrentCode(data.generated_code);
+      const reader = response.body.getReader();
+      const decoder = new TextDecoder();
+      let buffer = '';
+      let streamedCode = '';
+      
+      while (true) {
+        const { done, value } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+        
+        // Eventos SSE são separados por uma linha em branco
+        const events = buffer.split('\n\n');
+        buffer = events.pop() || '';
+        for (const rawEvent of events) {
+          const eventName = rawEvent.match(/^event: (.*)$/m)?.[1];
+          const dataLine = rawEvent.match(/^data: (.*)$/m)?.[1];
+          if (!eventName || !dataLine) continue;
+          const data = JSON.parse(dataLine);
+          
+          if (eventName === 'token') {
+            streamedCode += data.delta;
+            setCurrentCode(streamedCode);
+          } else if (eventName === 'code') {
+            setCurrentCode(data.generated_code);
+          } else if (eventName === 'result') {
+            setCurrentAnswer(data.answer);
+            setCurrentCode(data.generated_code);
+          } else if (eventName === 'error') {
+            throw new Error(data.detail || 'Erro ao processar a consulta');
+          }
+        }
+      }
       
     } catch (err) {
       setCurrentAnswer(`Erro: ${err instanceof Error ? err.message : 'Erro desconhecido'}`);
@@ -166,6 +196,20 @@ function App() {
     }
   }, [dataType, activeTable, dbPreviews]);
 
+  // Previews das tabelas são buscados sob demanda, apenas quando a tabela é selecionada
+  useEffect(() => {
+    if (dataType !== 'database' || !sessionId || !activeTable || dbPreviews[activeTable]) return;
+    const params = new URLSearchParams({ session_id: sessionId, tables: activeTable });
+    fetch(`${API_URL}/table_previews?${params}`)
+      .then((response) => (response.ok ? response.json() : null))
+      .then((data) => {
+        if (data) {
+          setDbPreviews((prev) => ({ ...prev, ...data.previews }));
+        }
+      })
+      .catch((err) => console.error('Erro ao carregar preview da tabela:', err));
+  }, [dataType, sessionId, activeTable, dbPreviews]);
+
   return (
     <div className="min-h-screen bg-gray-50 flex flex-col p-4">
       <header className="bg-white border-b py-4 px-6">
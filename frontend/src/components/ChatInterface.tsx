@@ -47,7 +47,7 @@ const ChatInterface: React.FC<ChatInterfaceProps> = ({
     if (chatContainerRef.current) {
       chatContainerRef.current.scrollTop = chatContainerRef.current.scrollHeight;
     }
-  }, [currentAnswer, history]);
+  }, [currentAnswer, currentCode, history]);
 
   return (
     <div className="flex flex-col h-full">
@@ -98,9 +98,16 @@ const ChatInterface: React.FC<ChatInterfaceProps> = ({
               <p>{currentQuestion}</p>
             </div>
             {isLoading ? (
-              <div className="bg-primary/10 p-3 rounded-lg animate-pulse">
-                <p>Processando...</p>
-              </div>
+              <>
+                <div className="bg-primary/10 p-3 rounded-lg animate-pulse">
+                  <p>Processando...</p>
+                </div>
+                {currentCode && (
+                  <div className="bg-gray-800 text-gray-100 p-3 rounded-lg font-mono text-sm overflow-x-auto">
+                    <pre>{currentCode}</pre>
+                  </div>
+                )}
+              </>
             ) : (
               currentAnswer && (
                 <>